@@ -0,0 +1,173 @@
+import numpy as np
+
+import snapshot
+import solver
+from main import BALLOON_COUNT, Player
+
+
+# Odds copied from the game, every chance below is exact rather than estimated
+AMBIENT_CHANCE = 0.10
+SCARE_CHANCE = 0.05
+SCARE_STEPS = 3
+WRONG_ANSWER_STEPS = 5
+BUTTON_CHANCE_PER_POP = 0.05
+COLOR_GUESSES = len(snapshot.COLOR_CODES)
+GRAVE_GUESSES = len(snapshot.GRAVE_ORDERS)
+
+STARTING_STEPS = Player(None).steps
+MAX_STEPS = 100
+
+
+# -----------------------------
+# Blue Button Drops
+# -----------------------------
+def button_chain():
+    # States 0..9: still waiting after that many pops, state 10: the button has dropped.
+    # The last balloon always drops it if it hasn't fallen yet
+    found = BALLOON_COUNT
+    chain = np.zeros((BALLOON_COUNT + 1, BALLOON_COUNT + 1))
+    for pops in range(BALLOON_COUNT - 1):
+        chance = min(1.0, (pops + 1) * BUTTON_CHANCE_PER_POP)
+        chain[pops, found] = chance
+        chain[pops, pops + 1] = 1 - chance
+    chain[BALLOON_COUNT - 1, found] = 1
+    chain[found, found] = 1
+    return chain
+
+
+def button_drop_distribution():
+    # Chance the button drops on pop 1, 2, ... 10
+    chain = button_chain()
+    state = np.zeros(BALLOON_COUNT + 1)
+    state[0] = 1
+    dropped = [0.0]
+    for _ in range(BALLOON_COUNT):
+        state = state @ chain
+        dropped.append(state[BALLOON_COUNT])
+    return np.diff(dropped)
+
+
+def expected_pops():
+    distribution = button_drop_distribution()
+    return float(distribution @ np.arange(1, BALLOON_COUNT + 1))
+
+
+# -----------------------------
+# Scares
+# -----------------------------
+def scare_loss_distribution(looks):
+    # Chance of losing 0, 3, 6, ... steps over this many looks, indexed by steps lost
+    distribution = np.zeros(looks * SCARE_STEPS + 1)
+    distribution[0] = 1
+    for _ in range(looks):
+        distribution = (1 - SCARE_CHANCE) * distribution + SCARE_CHANCE * np.roll(distribution, SCARE_STEPS)
+    return distribution
+
+
+def scare_loss_probability(looks, steps):
+    # Chance of losing at least this many steps to scares
+    return float(scare_loss_distribution(looks)[steps:].sum())
+
+
+def expected_ambient_events(looks):
+    return looks * AMBIENT_CHANCE
+
+
+# -----------------------------
+# Step Budget
+# -----------------------------
+# A turn is a distribution of step changes, {change: probability}
+def certain(change):
+    return {change: 1.0}
+
+
+def look_turn():
+    return {0: 1 - SCARE_CHANCE, -SCARE_STEPS: SCARE_CHANCE}
+
+
+def guessing_turn(answers):
+    # Guessing without repeats, the right answer is equally likely to come on any try.
+    # Steps only fall while guessing, so one combined turn dies exactly when the real tries would
+    return {-WRONG_ANSWER_STEPS * misses: 1 / answers for misses in range(answers)}
+
+
+def strategy_turns(looks=0, guess=False):
+    # The solver's shortest route, with extra looks after every move and,
+    # when guessing, the puzzles tried blind instead of using the notes' codes
+    table = solver.standard_table()
+    turns = []
+    key = table.start
+    while key in table.best:
+        action = table.best[key]
+        next_key, change = next((next_key, change) for name, next_key, change in table.graph[key] if name == action)
+        room = snapshot.ROOM_NAMES[key[0]]
+        if action == "solve" and guess:
+            turns.append(guessing_turn(COLOR_GUESSES if room == "Color Puzzle Room" else GRAVE_GUESSES))
+        else:
+            turns.append(certain(change))
+        if action.startswith("go ") and not solver.flag(next_key, "end"):
+            turns.extend(look_turn() for _ in range(looks))
+        key = next_key
+    return turns
+
+
+def transition_matrix(turn, size):
+    # Row is steps before the turn, column is steps after, 0 holds every game that has died
+    matrix = np.zeros((size, size))
+    matrix[0, 0] = 1
+    before = np.arange(1, size)
+    for change, probability in turn.items():
+        after = np.clip(before + change, 0, size - 1)
+        np.add.at(matrix, (before, after), probability)
+    return matrix
+
+
+def step_distributions(turns, max_steps=MAX_STEPS):
+    # Row s is the distribution of steps left after the route for a game starting with s steps
+    headroom = sum(max(turn) for turn in turns if max(turn) > 0)
+    size = max_steps + headroom + 1
+    state = np.eye(size)[:max_steps + 1]
+    for turn in turns:
+        state = state @ transition_matrix(turn, size)
+    return state
+
+
+def win_probability(turns, max_steps=MAX_STEPS):
+    # Reaching the Ringmaster with at least one step left wins, anything at 0 died on the way
+    return step_distributions(turns, max_steps)[:, 1:].sum(axis=1)
+
+
+STRATEGIES = {
+    "optimal": {},
+    "careful": {"looks": 1},
+    "guessing": {"guess": True},
+    "careful guessing": {"looks": 1, "guess": True},
+}
+
+
+def sweep(max_steps=MAX_STEPS):
+    # Win chance for every starting step budget, per strategy
+    return {name: win_probability(strategy_turns(**options), max_steps) for name, options in STRATEGIES.items()}
+
+
+if __name__ == "__main__":
+    import time
+
+    start = time.perf_counter()
+    results = sweep()
+    drops = button_drop_distribution()
+    elapsed = time.perf_counter() - start
+
+    print("Blue button drop by pop:")
+    for pops, chance in enumerate(drops, 1):
+        print(f"  pop {pops:>2}: {chance:6.2%}")
+    print(f"Expected pops until the button drops: {expected_pops():.3f}")
+    print(f"Chance 10 looks cost 3+ steps: {scare_loss_probability(10, SCARE_STEPS):.2%}")
+    print(f"\nWin chance with {STARTING_STEPS} steps:")
+    for name, chances in results.items():
+        print(f"  {name:<17}{chances[STARTING_STEPS]:8.2%}")
+    print("\nFewest starting steps for a 99% win:")
+    for name, chances in results.items():
+        enough = np.flatnonzero(chances >= 0.99)
+        print(f"  {name:<17}{enough[0] if len(enough) else f'over {MAX_STEPS}'}")
+    print(f"\nSweep time: {elapsed * 1000:.1f} ms")
@@ -0,0 +1,313 @@
+import numpy as np
+
+import snapshot
+from main import BALLOON_COUNT, DIRECTIONS, ITEMS, MANSION, Player
+
+
+# -----------------------------
+# Lookup Tables
+# -----------------------------
+ROOMS = snapshot.ROOM_INDEX
+ITEM = snapshot.ITEM_INDEX
+FLAG = {name: np.uint16(1 << bit) for bit, name in enumerate(snapshot.FLAGS)}
+BIT = np.array([1 << index for index in range(len(ITEMS))], dtype=np.uint16)
+DIRECTION_BIT = {direction: np.uint8(1 << bit) for bit, direction in enumerate(DIRECTIONS)}
+
+STARTING_STEPS = Player(None).steps
+START = ROOMS["Starting Room"]
+NOWHERE = -1
+
+# TARGETS[room, direction] is where an exit leads once it's open, hidden exits included
+TARGETS = np.full((len(ROOMS), len(DIRECTIONS)), NOWHERE, dtype=np.int8)
+for _name, _template in MANSION.items():
+    for _direction, _target in list(_template.hidden.items()) + list(_template.exits.items()):
+        TARGETS[ROOMS[_name], DIRECTIONS.index(_direction)] = ROOMS[_target]
+
+TEMPLATE_EXITS = np.array(snapshot.EXIT_MASKS, dtype=np.uint8)
+TEMPLATE_ITEM_ROOMS = np.frombuffer(snapshot.TEMPLATE_ITEM_ROOMS, dtype=np.uint8).astype(np.int8)
+
+COLOR_ORDERS = np.array([[("red", "green", "blue", "yellow").index(color) for color in code]
+                         for code in snapshot.COLOR_CODES], dtype=np.int8)
+GRAVE_ORDERS = np.array([[snapshot.GRAVES.index(grave) for grave in order]
+                         for order in snapshot.GRAVE_ORDERS], dtype=np.int8)
+PUZZLE = {name: index for index, name in enumerate(snapshot.PUZZLES)}
+
+# One action per game per step, every id is also a command main.py understands
+ACTIONS = (
+    [f"go {direction}" for direction in DIRECTIONS]
+    + [f"take {item}" for item in ITEMS]
+    + [f"use {item}" for item in ITEMS]
+    + ["look", "lift", "solve", "quit"]
+    + [" ".join(code) for code in snapshot.COLOR_CODES]
+    + list(snapshot.GRAVES)
+    + ["back"]
+)
+ACTION_INDEX = {command: index for index, command in enumerate(ACTIONS)}
+GO = ACTION_INDEX["go forward"]
+TAKE = ACTION_INDEX[f"take {ITEMS[0]}"]
+USE = ACTION_INDEX[f"use {ITEMS[0]}"]
+LOOK, LIFT, SOLVE, QUIT = (ACTION_INDEX[name] for name in ("look", "lift", "solve", "quit"))
+COLOR_ANSWER = ACTION_INDEX[" ".join(snapshot.COLOR_CODES[0])]
+GRAVE_ANSWER = ACTION_INDEX[snapshot.GRAVES[0]]
+BACK = ACTION_INDEX["back"]
+
+
+def encode_actions(commands):
+    return np.array([ACTION_INDEX[command] for command in commands], dtype=np.int16)
+
+
+# -----------------------------
+# Batch Environment
+# -----------------------------
+class BatchEnv:
+    # N games as parallel arrays, step() moves all of them with one action each.
+    # Only what changes the game is kept, text, visited rooms and descriptions are left out
+    def __init__(self, n, seed=None):
+        self.n = n
+        self.rng = np.random.default_rng(seed)
+        self.room = np.empty(n, dtype=np.int8)
+        self.steps = np.empty(n, dtype=np.int16)
+        self.inventory = np.empty(n, dtype=np.uint16)
+        self.item_rooms = np.empty((n, len(ITEMS)), dtype=np.int8)  # room index + 1, 0 when carried or gone
+        self.exits = np.empty((n, len(ROOMS)), dtype=np.uint8)       # open direction bits per room
+        self.flags = np.empty(n, dtype=np.uint16)
+        self.pops = np.empty(n, dtype=np.int8)
+        self.scares = np.empty(n, dtype=np.int16)
+        self.ambient = np.empty(n, dtype=np.int16)
+        self.color = np.empty(n, dtype=np.int8)                       # index into snapshot.COLOR_CODES
+        self.grave = np.empty(n, dtype=np.int8)                       # index into snapshot.GRAVE_ORDERS
+        self.puzzle = np.empty(n, dtype=np.int8)
+        self.grave_picks = np.empty(n, dtype=np.int8)
+        self.grave_right = np.empty(n, dtype=bool)
+        self.reset()
+
+    @classmethod
+    def from_snapshots(cls, snapshots, seed=None):
+        env = cls(len(snapshots), seed)
+        for index, data in enumerate(snapshots):
+            (version, room, steps, inventory, item_rooms, flags, pops, scares, turns, misses, codes, ambient, major,
+             puzzle, visited, exits, descriptions, rng_state) = snapshot.RECORD.unpack(data)
+            env.room[index] = room
+            env.steps[index] = steps
+            env.inventory[index] = inventory
+            env.item_rooms[index] = np.frombuffer(item_rooms, dtype=np.uint8)
+            env.exits[index] = [exits[position >> 1] >> (position & 1) * 4 & 0xF for position in range(len(ROOMS))]
+            env.flags[index] = flags
+            env.pops[index] = pops
+            env.scares[index] = scares
+            env.color[index], env.grave[index] = divmod(codes, len(snapshot.GRAVE_ORDERS))
+            env.puzzle[index] = puzzle & 0b11
+            env.grave_picks[index] = puzzle >> 2 & 0b11
+            order = GRAVE_ORDERS[env.grave[index]]
+            env.grave_right[index] = all(puzzle >> (4 + position * 2) & 0b11 == order[position]
+                                         for position in range(env.grave_picks[index]))
+        return env
+
+    def reset(self, mask=None):
+        games = slice(None) if mask is None else np.flatnonzero(mask)
+        count = self.n if mask is None else len(games)
+        self.room[games] = START
+        self.steps[games] = STARTING_STEPS
+        self.inventory[games] = 0
+        self.item_rooms[games] = TEMPLATE_ITEM_ROOMS
+        self.exits[games] = TEMPLATE_EXITS
+        self.flags[games] = 0
+        self.pops[games] = 0
+        self.scares[games] = 0
+        self.ambient[games] = 0
+        self.color[games] = self.rng.integers(len(COLOR_ORDERS), size=count)
+        self.grave[games] = self.rng.integers(len(GRAVE_ORDERS), size=count)
+        self.puzzle[games] = PUZZLE[None]
+        self.grave_picks[games] = 0
+        self.grave_right[games] = True
+
+    @property
+    def done(self):
+        # game_loop stops once the steps run out or something ends the game
+        return (self.flags & FLAG["end"] != 0) | (self.steps <= 0)
+
+    @property
+    def won(self):
+        return self.flags & FLAG["won"] != 0
+
+    def has(self, games, item):
+        return self.inventory[games] & BIT[ITEM[item]] != 0
+
+    def set_flag(self, games, name):
+        self.flags[games] |= FLAG[name]
+
+    def step(self, actions):
+        actions = np.asarray(actions)
+        live = ~self.done
+        # A pending puzzle takes whatever comes next as its answer, like handle_command
+        free = live & (self.puzzle == PUZZLE[None])
+        color = np.flatnonzero(live & (self.puzzle == PUZZLE["color"]))
+        graves = np.flatnonzero(live & (self.puzzle == PUZZLE["graveyard"]))
+
+        self.go(np.flatnonzero(free & (actions >= GO) & (actions < TAKE)), actions)
+        self.take(np.flatnonzero(free & (actions >= TAKE) & (actions < USE)), actions)
+        self.use(np.flatnonzero(free & (actions >= USE) & (actions < LOOK)), actions)
+        self.look(np.flatnonzero(free & (actions == LOOK)))
+        self.lift(np.flatnonzero(free & (actions == LIFT)))
+        self.solve(np.flatnonzero(free & (actions == SOLVE)))
+        self.set_flag(np.flatnonzero(free & (actions == QUIT)), "end")
+        self.color_answer(color, actions[color])
+        self.graveyard_answer(graves, actions[graves])
+        return self.done
+
+    # -----------------------------
+    # Commands
+    # -----------------------------
+    def go(self, games, actions):
+        direction = actions[games] - GO
+        room = self.room[games]
+        open_ = (self.exits[games, room] >> direction) & 1 == 1
+        games, direction, room = games[open_], direction[open_], room[open_]
+        self.steps[games] -= 1
+        self.room[games] = TARGETS[room, direction]
+        self.enter(games)
+
+    def enter(self, games):
+        room = self.room[games]
+
+        final = games[room == ROOMS["Ringmaster’s Chamber"]]
+        escaped = final[self.has(final, "dagger") & (self.steps[final] >= 1)]
+        self.set_flag(escaped, "won")
+        self.set_flag(final, "end")
+
+        self.steps[games[room == ROOMS["Secret Room"]]] += 2
+
+        # trap_event, the clowns chase the nose into the Portrait Room and the way back shuts
+        hallway = games[room == ROOMS["Hallway to Clown Gallery"]]
+        trapped = hallway[self.has(hallway, "clown nose")]
+        self.room[trapped] = ROOMS["Portrait Room"]
+        self.exits[trapped, ROOMS["Portrait Room"]] &= ~DIRECTION_BIT["right"]
+
+    def take(self, games, actions):
+        item = actions[games] - TAKE
+        here = self.item_rooms[games, item] == self.room[games] + 1
+        games, item = games[here], item[here]
+        self.inventory[games] |= BIT[item]
+        self.item_rooms[games, item] = 0
+        # The color note's statue breaks and leaves the clown nose behind
+        note = games[item == ITEM["color note"]]
+        self.item_rooms[note, ITEM["clown nose"]] = self.room[note] + 1
+
+    def use(self, games, actions):
+        item = actions[games] - USE
+        held = self.inventory[games] & BIT[item] != 0
+        games, item = games[held], item[held]
+        room = self.room[games]
+
+        def rule(name, where):
+            return games[(item == ITEM[name]) & (room == ROOMS[where])]
+
+        crowbar = rule("crowbar", "Mirror Room")
+        self.exits[crowbar, ROOMS["Mirror Room"]] |= DIRECTION_BIT["forward"]
+        self.inventory[crowbar] &= ~BIT[ITEM["crowbar"]]
+
+        lever = rule("lever", "Portrait Room")
+        self.set_flag(lever, "dagger_unlocked")
+        self.inventory[lever] &= ~BIT[ITEM["lever"]]
+        self.item_rooms[lever, ITEM["dagger"]] = ROOMS["Portrait Room"] + 1
+
+        self.pop_balloon(rule("dagger", "Balloon Room"))
+
+        button = rule("blue button", "Color Puzzle Room")
+        self.set_flag(button, "color_puzzle_unlocked")
+        self.inventory[button] &= ~BIT[ITEM["blue button"]]
+
+        wheel = rule("wheel handle", "Circus Room")
+        self.exits[wheel, ROOMS["Circus Room"]] |= DIRECTION_BIT["left"]
+        self.inventory[wheel] &= ~BIT[ITEM["wheel handle"]]
+
+    def look(self, games):
+        # ambient_event only prints, so it's just counted, major_scare_event costs 3 steps
+        ambient, major = self.rng.integers(1, 101, size=(2, len(games)))
+        self.ambient[games[ambient <= 10]] += 1
+        scared = games[major <= 5]
+        self.steps[scared] -= 3
+        self.scares[scared] += 1
+
+    def lift(self, games):
+        self.set_flag(games[self.room[games] == ROOMS["Dining Hall"]], "lifted")
+
+    def solve(self, games):
+        room = self.room[games]
+        graveyard = games[room == ROOMS["Graveyard"]]
+        graveyard = graveyard[self.flags[graveyard] & FLAG["grave_solved"] == 0]
+        self.puzzle[graveyard] = PUZZLE["graveyard"]
+        self.grave_picks[graveyard] = 0
+        self.grave_right[graveyard] = True
+
+        panel = games[room == ROOMS["Color Puzzle Room"]]
+        ready = self.flags[panel] & (FLAG["color_solved"] | FLAG["color_puzzle_unlocked"]) == FLAG["color_puzzle_unlocked"]
+        self.puzzle[panel[ready]] = PUZZLE["color"]
+
+    # -----------------------------
+    # Puzzles
+    # -----------------------------
+    def pop_balloon(self, games):
+        games = games[self.flags[games] & FLAG["secret_room_opened"] == 0]
+        self.pops[games] += 1
+        # The drop chance grows 5% a pop, no roll once the button has fallen
+        waiting = games[self.flags[games] & FLAG["blue_button_found"] == 0]
+        rolls = self.rng.integers(1, 101, size=len(waiting))
+        self.drop_button(waiting[rolls <= self.pops[waiting].astype(np.int16) * 5])
+
+        popped = games[self.pops[games] >= BALLOON_COUNT]
+        self.set_flag(popped, "secret_room_opened")
+        self.exits[popped, ROOMS["Balloon Room"]] |= DIRECTION_BIT["left"]
+        self.drop_button(popped[self.flags[popped] & FLAG["blue_button_found"] == 0])
+
+    def drop_button(self, games):
+        self.set_flag(games, "blue_button_found")
+        self.item_rooms[games, ITEM["blue button"]] = ROOMS["Balloon Room"] + 1
+
+    def color_answer(self, games, actions):
+        # Any answer closes the panel, only a full guess costs steps when it's wrong
+        self.puzzle[games] = PUZZLE[None]
+        guess = (actions >= COLOR_ANSWER) & (actions < COLOR_ANSWER + len(COLOR_ORDERS))
+        games, actions = games[guess], actions[guess]
+        right = actions - COLOR_ANSWER == self.color[games]
+        solved = games[right]
+        self.set_flag(solved, "color_solved")
+        self.exits[solved, ROOMS["Color Puzzle Room"]] |= DIRECTION_BIT["forward"]
+        self.steps[games[~right]] -= 5
+
+    def graveyard_answer(self, games, actions):
+        choice = (actions >= GRAVE_ANSWER) & (actions < BACK)
+        # "back" or anything that isn't a grave walks away from the puzzle
+        self.puzzle[games[~choice]] = PUZZLE[None]
+        games, grave = games[choice], actions[choice] - GRAVE_ANSWER
+        picks = self.grave_picks[games]
+        self.grave_right[games] &= GRAVE_ORDERS[self.grave[games], picks] == grave
+        self.grave_picks[games] = picks + 1
+
+        finished = games[picks + 1 == len(snapshot.GRAVES)]
+        self.puzzle[finished] = PUZZLE[None]
+        right = self.grave_right[finished]
+        solved = finished[right]
+        self.set_flag(solved, "grave_solved")
+        self.item_rooms[solved, ITEM["wheel handle"]] = ROOMS["Graveyard"] + 1
+        self.steps[finished[~right]] -= 5
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Step many games at once with random actions.")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--steps", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    env = BatchEnv(args.games, args.seed)
+    start = time.perf_counter()
+    for _ in range(args.steps):
+        env.step(env.rng.integers(len(ACTIONS), size=args.games))
+    elapsed = time.perf_counter() - start
+    print(f"Stepped {args.games:,} games x {args.steps} actions in {elapsed:.2f}s "
+          f"({args.games * args.steps / elapsed:,.0f} game-steps/sec)")
+    print(f"Finished: {env.done.mean():.1%}   Won: {env.won.mean():.2%}")
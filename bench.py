@@ -0,0 +1,197 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import snapshot
+from main import NULL_SINK, setup_game, handle_command
+from simulate import ScriptedPolicy
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+SEED = 1234
+
+
+# -----------------------------
+# Starting Positions
+# -----------------------------
+def state_after(commands, seed=SEED):
+    player, game_state = setup_game(seed, out=NULL_SINK)
+    player.location.enter(player, game_state)
+    for command in commands:
+        handle_command(player, game_state, command)
+    return snapshot.save(player, game_state)
+
+
+SCRIPT = ScriptedPolicy.SCRIPT
+BALLOON_ROOM = SCRIPT[:SCRIPT.index("use dagger")]
+COLOR_PANEL = SCRIPT[:SCRIPT.index("use blue button") + 1]
+
+
+# -----------------------------
+# Benchmarks
+# -----------------------------
+# Each benchmark returns a prepare() run outside the timer and an op() that is timed
+def bench_setup():
+    seeds = iter(range(SEED, SEED + 10 ** 9))
+    return None, lambda: setup_game(next(seeds), out=NULL_SINK)
+
+
+def command_bench(start, command, reset_every=1):
+    data = state_after(start)
+    game = {}
+    count = [0]
+
+    def prepare():
+        if count[0] % reset_every == 0:
+            game["player"], game["state"] = snapshot.restore(data, NULL_SINK)
+        game["player"].steps = 50
+        count[0] += 1
+
+    def op():
+        handle_command(game["player"], game["state"], command)
+
+    return prepare, op
+
+
+def bench_go():
+    # Walk back and forth between the starting room and the main hall
+    data = state_after(["go forward"])
+    player, game_state = snapshot.restore(data, NULL_SINK)
+    directions = ["go back", "go forward"]
+    count = [0]
+
+    def prepare():
+        player.steps = 50
+        count[0] += 1
+
+    def op():
+        handle_command(player, game_state, directions[count[0] & 1])
+
+    return prepare, op
+
+
+def bench_look():
+    # ambient_event and major_scare_event roll on every look
+    return command_bench(["go forward"], "look", reset_every=1000)
+
+
+def bench_pop_balloon():
+    return command_bench(BALLOON_ROOM, "use dagger", reset_every=10)
+
+
+def bench_solve():
+    data = state_after(COLOR_PANEL)
+    game = {}
+
+    def prepare():
+        game["player"], game["state"] = snapshot.restore(data, NULL_SINK)
+        handle_command(game["player"], game["state"], "solve")
+
+    def op():
+        handle_command(game["player"], game["state"], " ".join(game["state"].color_code))
+
+    return prepare, op
+
+
+BENCHMARKS = {
+    "setup_game": bench_setup,
+    "go": bench_go,
+    "look": bench_look,
+    "use dagger": bench_pop_balloon,
+    "solve color": bench_solve,
+}
+
+
+def run_benchmark(factory, iterations):
+    prepare, op = factory()
+    timings = []
+    clock = time.perf_counter_ns
+    gc.disable()
+    try:
+        for _ in range(iterations):
+            if prepare:
+                prepare()
+            start = clock()
+            op()
+            timings.append(clock() - start)
+    finally:
+        gc.enable()
+    timings.sort()
+    total = sum(timings)
+    return {
+        "ops_per_sec": round(iterations / (total / 1e9)),
+        "p50_ns": timings[len(timings) // 2],
+        "p99_ns": timings[int(len(timings) * 0.99)],
+    }
+
+
+def session_bytes(sessions=2000):
+    # A live Player + GameState + its world overlay, partway into a game
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    games = []
+    for seed in range(sessions):
+        player, game_state = setup_game(seed, out=NULL_SINK)
+        player.location.enter(player, game_state)
+        for command in SCRIPT[:12]:
+            handle_command(player, game_state, command)
+        games.append((player, game_state))
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return round((after - before) / sessions)
+
+
+# -----------------------------
+# Baselines
+# -----------------------------
+def compare(results, baseline, threshold):
+    failures = []
+    for name, result in results["commands"].items():
+        before = baseline["commands"].get(name)
+        if before and result["p50_ns"] > before["p50_ns"] * (1 + threshold):
+            failures.append(f"{name}: p50 {result['p50_ns']}ns vs baseline {before['p50_ns']}ns")
+    if results["bytes_per_session"] > baseline["bytes_per_session"] * (1 + threshold):
+        failures.append(f"memory: {results['bytes_per_session']} bytes/session vs baseline {baseline['bytes_per_session']}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the game's hot paths.")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown before failing, 0.25 = 25%%")
+    parser.add_argument("--save", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--baseline", default=BASELINE)
+    args = parser.parse_args()
+
+    results = {"commands": {}, "bytes_per_session": session_bytes()}
+    print(f"{'benchmark':<14}{'ops/sec':>12}{'p50 (us)':>12}{'p99 (us)':>12}")
+    for name, factory in BENCHMARKS.items():
+        result = results["commands"][name] = run_benchmark(factory, args.iterations)
+        print(f"{name:<14}{result['ops_per_sec']:>12,}{result['p50_ns'] / 1000:>12.2f}{result['p99_ns'] / 1000:>12.2f}")
+    print(f"\nMemory per session: {results['bytes_per_session']:,} bytes")
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("No baseline yet, run with --save to store one.")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    failures = compare(results, baseline, args.threshold)
+    for failure in failures:
+        print(f"REGRESSION {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,303 @@
+import argparse
+import hashlib
+import os
+import time
+import traceback
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import snapshot
+from main import COMMANDS, DIRECTIONS, ITEMS, NULL_SINK, handle_command, setup_game
+
+
+# Topped up before every command so no path dies of exhaustion, the step budget isn't what we're testing
+EXPLORE_STEPS = 100
+CHUNK = 256  # states per task handed to a worker
+
+# Every line worth trying outside a puzzle, including the ones that should just be refused
+COMMAND_LINES = [f"go {direction}" for direction in DIRECTIONS]
+COMMAND_LINES += [f"take {item}" for item in ITEMS] + [f"use {item}" for item in ITEMS]
+COMMAND_LINES += [name for name, (handler, takes_object) in COMMANDS.items() if not takes_object and name != "quit"]
+COMMAND_LINES += ["dance"]
+
+PUZZLE_LINES = {
+    "color": [" ".join(code) for code in snapshot.COLOR_CODES] + ["back", "red"],
+    "graveyard": list(snapshot.GRAVES) + ["back", "first"],
+}
+
+WON = 1 << snapshot.FLAGS.index("won")
+END = 1 << snapshot.FLAGS.index("end")
+
+
+# -----------------------------
+# State Hashing
+# -----------------------------
+def fields(data):
+    (version, room, steps, inventory, item_rooms, flags, pops, scares, turns, misses, codes, ambient, major,
+     puzzle, visited, exits, descriptions, rng_state) = snapshot.RECORD.unpack(data)
+    return room, inventory, item_rooms, flags, pops, puzzle, exits, descriptions
+
+
+def state_hash(data):
+    # 8 bytes standing for everything that decides what can happen next. Steps, visits, event pools
+    # and the rng only change text or timing, so states differing in just those are merged.
+    # Leaving the rng out is safe because every random roll is explored both ways, see ForcedRolls
+    room, inventory, item_rooms, flags, pops, puzzle, exits, descriptions = fields(data)
+    key = bytes((room, pops, puzzle & 0xFF, puzzle >> 8)) + inventory.to_bytes(2, "little")
+    key += flags.to_bytes(2, "little") + item_rooms + exits + descriptions
+    return hashlib.blake2b(key, digest_size=8).digest()
+
+
+def coverage_key(before, after, move):
+    # Which kind of thing a command did where: its verb, the room, and which parts of the state it touched
+    old, new = fields(before), fields(after)
+    touched = sum(1 << position for position, (a, b) in enumerate(zip(old, new)) if a != b)
+    line, outcomes = move
+    return old[0], line.split(" ", 1)[0], outcomes, touched
+
+
+# -----------------------------
+# Random Rolls
+# -----------------------------
+class ForcedRolls:
+    # Stands in for a game's rng while one command runs. Every percentage roll (ambient events,
+    # scares, the button drop) comes out as scripted, a hit for True and a miss for anything else,
+    # so each outcome gets explored instead of only whichever one the seed gives
+    def __init__(self, rng, outcomes):
+        self.rng = rng
+        self.outcomes = outcomes
+        self.rolls = 0
+
+    def randint(self, a, b):
+        if (a, b) != (1, 100):
+            return self.rng.randint(a, b)
+        hit = self.rolls < len(self.outcomes) and self.outcomes[self.rolls]
+        self.rolls += 1
+        return a if hit else b
+
+    def __getattr__(self, name):
+        return getattr(self.rng, name)
+
+
+def describe_move(move):
+    line, outcomes = move
+    if not any(outcomes):
+        return line
+    return f"{line} ({', '.join('hit' if hit else 'miss' for hit in outcomes)})"
+
+
+# -----------------------------
+# Expansion (runs in the workers)
+# -----------------------------
+def command_lines(data):
+    puzzle = snapshot.PUZZLES[fields(data)[5] & 0b11]
+    return PUZZLE_LINES[puzzle] if puzzle else COMMAND_LINES
+
+
+def run_move(data, move):
+    # Returns the state after, and how many percentage rolls the command made
+    line, outcomes = move
+    player, game_state = snapshot.restore(data, NULL_SINK)
+    player.steps = EXPLORE_STEPS
+    rolls = game_state.rng = ForcedRolls(game_state.rng, outcomes)
+    handle_command(player, game_state, line)
+    game_state.rng = rolls.rng
+    return snapshot.save(player, game_state), rolls.rolls
+
+
+def moves(data, line):
+    # Every combination of hits and misses the line's rolls can come out as. Rolls past the
+    # scripted ones miss, so each run schedules the ones that turn one of those into a hit
+    pending = [()]
+    while pending:
+        outcomes = pending.pop()
+        move = (line, outcomes)
+        try:
+            after, rolls = run_move(data, move)
+        except Exception as error:
+            yield move, None, error
+            continue
+        yield move, after, None
+        for position in range(len(outcomes), rolls):
+            pending.append(outcomes + (False,) * (position - len(outcomes)) + (True,))
+
+
+def expand(data):
+    # (move, state after, its hash, crash signature) for every move that changed something or crashed,
+    # and how many moves were tried
+    edges = []
+    tried = 0
+    key = state_hash(data)
+    for line in command_lines(data):
+        for move, after, error in moves(data, line):
+            tried += 1
+            if error is not None:
+                frame = traceback.extract_tb(error.__traceback__)[-1]
+                where = f"{os.path.basename(frame.filename)}:{frame.lineno}"
+                edges.append((move, None, None, (type(error).__name__, str(error), where)))
+                continue
+            next_key = state_hash(after)
+            if next_key != key:
+                edges.append((move, after, next_key, None))
+    return edges, tried
+
+
+def expand_chunk(states):
+    return [expand(data) for data in states]
+
+
+# -----------------------------
+# Search
+# -----------------------------
+class Exploration:
+    # Breadth first, so the first path found to any state is a shortest one
+    def __init__(self, seed=0):
+        player, game_state = setup_game(seed, out=NULL_SINK)
+        player.location.enter(player, game_state)
+        self.seed = seed
+        self.start = snapshot.save(player, game_state)
+        start = state_hash(self.start)
+        self.parents = {start: None}  # state -> (previous state, move)
+        self.flags = {start: fields(self.start)[3]}
+        self.predecessors = defaultdict(list)
+        self.frontier = [self.start]
+        self.crashes = {}  # signature -> (state, move) where it first happened
+        self.coverage = set()
+        self.commands = 0     # every line tried, once per way its rolls came out
+        self.transitions = 0  # the ones that changed the state
+        self.expanded = 0
+
+    def run(self, workers=None, max_states=None):
+        pool = ProcessPoolExecutor(workers) if workers != 1 else None
+        try:
+            while self.frontier:
+                if max_states is not None:
+                    if self.expanded >= max_states:
+                        break
+                    self.frontier = self.frontier[:max_states - self.expanded]
+                self.step(pool)
+        finally:
+            if pool:
+                pool.shutdown()
+        return self
+
+    def step(self, pool):
+        chunks = [self.frontier[start:start + CHUNK] for start in range(0, len(self.frontier), CHUNK)]
+        results = pool.map(expand_chunk, chunks) if pool else map(expand_chunk, chunks)
+        novel, familiar = [], []
+        for chunk, expansions in zip(chunks, results):
+            for data, (edges, commands) in zip(chunk, expansions):
+                self.expanded += 1
+                self.commands += commands
+                key = state_hash(data)
+                for move, after, next_key, crash in edges:
+                    if crash is not None:
+                        self.crashes.setdefault(crash, (key, move))
+                        continue
+                    self.transitions += 1
+                    self.predecessors[next_key].append(key)
+                    if next_key in self.parents:
+                        continue
+                    self.parents[next_key] = (key, move)
+                    flags = self.flags[next_key] = fields(after)[3]
+                    if flags & END:
+                        continue
+                    # Within a depth, states reached by something new are looked at first
+                    seen = coverage_key(data, after, move)
+                    if seen in self.coverage:
+                        familiar.append(after)
+                    else:
+                        self.coverage.add(seen)
+                        novel.append(after)
+        self.frontier = novel + familiar
+
+    # --- Results ---
+    def trace(self, key):
+        # The moves leading to a state, each a line and how its rolls came out
+        path = []
+        while self.parents[key] is not None:
+            key, move = self.parents[key]
+            path.append(move)
+        return path[::-1]
+
+    def winnable(self):
+        # Everything a won state can be reached from
+        queue = deque(key for key, flags in self.flags.items() if flags & WON)
+        reached = set(queue)
+        while queue:
+            for previous in self.predecessors[queue.popleft()]:
+                if previous not in reached:
+                    reached.add(previous)
+                    queue.append(previous)
+        return reached
+
+    def softlocks(self):
+        # The moves that strand a player: from a state that could still win into one that never can.
+        # One shortest example per room and command
+        winnable = self.winnable()
+        stranding = {}
+        for key, parent in self.parents.items():
+            if key in winnable or parent is None or self.flags[key] & END or parent[0] not in winnable:
+                continue
+            trace = self.trace(key)
+            room = snapshot.ROOM_NAMES[self.room_of(parent[0])]
+            previous = stranding.get((room, parent[1]))
+            if previous is None or len(trace) < len(previous):
+                stranding[room, parent[1]] = trace
+        return stranding
+
+    def room_of(self, key):
+        # Walks the trace to rebuild the room, the hash alone doesn't keep it
+        return fields(self.replay(self.trace(key)))[0]
+
+    def replay(self, path):
+        data = self.start
+        for move in path:
+            data, rolls = run_move(data, move)
+        return data
+
+
+def reproduce(seed, path):
+    # Plays a trace the way the explorer did, raising whatever it raised
+    player, game_state = setup_game(seed, out=NULL_SINK)
+    player.location.enter(player, game_state)
+    for line, outcomes in path:
+        player.steps = EXPLORE_STEPS
+        rolls = game_state.rng = ForcedRolls(game_state.rng, outcomes)
+        try:
+            handle_command(player, game_state, line)
+        finally:
+            game_state.rng = rolls.rng
+    return player, game_state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Explore every reachable game state for crashes and dead ends.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, help="worker processes, defaults to one per core")
+    parser.add_argument("--max-states", type=int, help="stop after expanding this many states")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    exploration = Exploration(args.seed).run(args.workers, args.max_states)
+    elapsed = time.perf_counter() - start
+    print(f"States: {len(exploration.parents):,} found, {exploration.expanded:,} expanded, "
+          f"{exploration.transitions:,} transitions")
+    print(f"Commands: {exploration.commands:,} in {elapsed:.1f}s ({exploration.commands / elapsed * 60:,.0f}/min)")
+    print(f"Coverage: {len(exploration.coverage):,} distinct command effects")
+    wins = sum(1 for flags in exploration.flags.values() if flags & WON)
+    print(f"Winning states: {wins:,}")
+
+    print(f"\nCrashes: {len(exploration.crashes)}")
+    for (name, message, where), (key, move) in exploration.crashes.items():
+        trace = exploration.trace(key) + [move]
+        print(f"  {name}: {message} at {where}")
+        print(f"    seed {args.seed}: {' / '.join(map(describe_move, trace))}")
+
+    if exploration.frontier:
+        raise SystemExit("\nStopped before every state was expanded, so dead ends can't be told apart yet")
+    stranding = exploration.softlocks()
+    print(f"\nMoves that make the game unwinnable: {len(stranding)}")
+    for (room, move), trace in sorted(stranding.items(), key=lambda entry: len(entry[1])):
+        print(f"  {describe_move(move)!r} in {room}, {len(trace)} moves:")
+        print(f"    seed {args.seed}: {' / '.join(map(describe_move, trace))}")
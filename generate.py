@@ -0,0 +1,137 @@
+import argparse
+import copy
+import json
+import random
+import time
+
+from main import DIRECTIONS, MANSION, MANSION_PATH, NULL_SINK, check_mansion, handle_command, setup_game
+from mansion import load_mansion
+from simulate import ScriptedPolicy
+
+
+# Filler rooms borrow the plain connecting rooms of the hand-built mansion, which have no puzzles,
+# items or triggers, so no rule can ever fire in one
+FILLER = (
+    ("Corridor", "A narrow corridor with faded posters for an old circus."),
+    ("Stairway", "A spiraling stairway with creaky steps."),
+    ("Passage", "Cold air flows through this dim passage."),
+    ("Hallway", "The hallway feels smaller the further you go."),
+    ("Stretch", "The last stretch... or so it seems."),
+)
+CHILD_DIRECTIONS = ("forward", "left", "right")  # "back" always leads where the room was reached from
+LOOPS = 0.05  # extra links per filler room, so wings aren't all dead ends. Always within one wing
+
+
+# -----------------------------
+# Generation
+# -----------------------------
+def generate(rooms, seed=None, base=None, loops=LOOPS):
+    # Grows wings of filler rooms off every free doorway of the base mansion. Every room and exit of
+    # the base is kept as it was, and a wing only ever touches the one room it grew from, so no
+    # filler path can walk around a locked door or a puzzle
+    if base is None:
+        with open(MANSION_PATH, encoding="utf-8") as f:
+            base = json.load(f)
+    if rooms < len(base["rooms"]):
+        raise ValueError(f"The base mansion already has {len(base['rooms'])} rooms")
+    rng = random.Random(seed)
+    data = copy.deepcopy(base)
+    colors = sorted({room["color"] for room in base["rooms"]})
+
+    free = []  # (room, direction) doorways nothing uses yet, some may have been taken since
+    wing_free = {}  # wing -> the same, for the filler rooms of that wing only
+    wings = {}  # filler room name -> the wing it belongs to
+    for room in data["rooms"]:
+        used = set(room.get("exits", {})) | set(room.get("hidden", {}))
+        # The chamber ends the game on entry, a doorway out of it could never be used
+        if room.get("exits") or room.get("hidden"):
+            free += [(room, direction) for direction in DIRECTIONS if direction not in used]
+
+    def take_free(doorways):
+        while doorways:
+            position = rng.randrange(len(doorways))
+            doorways[position], doorways[-1] = doorways[-1], doorways[position]
+            room, direction = doorways.pop()
+            if direction not in room["exits"]:
+                return room, direction
+        return None
+
+    for number in range(1, rooms - len(base["rooms"]) + 1):
+        parent, direction = take_free(free)
+        stem, description = rng.choice(FILLER)
+        room = {"name": f"{stem} {number}", "color": rng.choice(colors), "description": description,
+                "exits": {"back": parent["name"]}}
+        parent.setdefault("exits", {})[direction] = room["name"]
+        data["rooms"].append(room)
+        # A room grown off the base mansion starts a new wing
+        wing = wings[room["name"]] = wings.get(parent["name"], number)
+        doorways = [(room, direction) for direction in CHILD_DIRECTIONS]
+        free += doorways
+        wing_free.setdefault(wing, []).extend(doorways)
+
+        if rng.random() < loops:
+            first, second = take_free(wing_free[wing]), take_free(wing_free[wing])
+            if first is None or second is None or first[0] is second[0]:
+                wing_free[wing] += [doorway for doorway in (first, second) if doorway is not None]
+            else:
+                (first, one_way), (second, other_way) = first, second
+                first["exits"][one_way] = second["name"]
+                second["exits"][other_way] = first["name"]
+    return data
+
+
+def bypasses(mansion, base_rooms):
+    # (room, room) pairs of the base mansion joined by a path through filler rooms alone.
+    # Any pair at all means some door, trap or puzzle can be walked around
+    found = []
+    for name in base_rooms:
+        queue = [target for target in mansion[name].exits.values() if target not in base_rooms]
+        reached = set(queue)
+        while queue:
+            room = queue.pop()
+            for target in mansion[room].exits.values():
+                if target in base_rooms:
+                    if target != name:
+                        found.append((name, target))
+                elif target not in reached:
+                    reached.add(target)
+                    queue.append(target)
+    return found
+
+
+def verify(mansion, seed=0):
+    # Plays the intended walkthrough, which only ever uses the base mansion's own exits
+    player, game_state = setup_game(seed, out=NULL_SINK, mansion=mansion)
+    policy = ScriptedPolicy(seed)
+    player.location.enter(player, game_state)
+    while player.steps > 0 and not game_state.end:
+        command = policy.answer(player, game_state) if game_state.puzzle else policy.choose(player, game_state)
+        handle_command(player, game_state, command)
+    return game_state.won
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a large procedural mansion from the hand-built one.")
+    parser.add_argument("output", help="mansion data file to write")
+    parser.add_argument("--rooms", type=int, default=100000)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--loops", type=float, default=LOOPS, help="extra links per filler room")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    data = generate(args.rooms, args.seed, loops=args.loops)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    generated = time.perf_counter() - start
+
+    mansion = load_mansion(args.output)
+    check_mansion(mansion)
+    joined = bypasses(mansion, {room["name"] for room in data["rooms"][:len(MANSION)]})
+    if joined:
+        first, second = joined[0]
+        raise SystemExit(f"Filler rooms join {len(joined)} pairs of rooms, e.g. {first} to {second}")
+    if not verify(mansion):
+        raise SystemExit("The walkthrough failed on the generated mansion")
+    compiled = len(mansion.buffer)
+    print(f"{args.output}: {len(mansion):,} rooms, generated in {generated:.1f}s, "
+          f"{compiled:,} bytes compiled ({compiled / len(mansion):.0f} per room), walkthrough wins")
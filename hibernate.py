@@ -0,0 +1,73 @@
+import sqlite3
+from collections import OrderedDict
+
+from replay import pack_session, unpack_session
+
+SESSION_BYTES = 1600  # a live Player + GameState, see bench.py's memory figure
+
+
+# -----------------------------
+# Session Store
+# -----------------------------
+class SessionStore:
+    # Sleeping games on disk as packed sessions: seed, snapshot, then the command log if recording
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, isolation_level=None)
+        # A cache of live connections, so it's rebuilt empty every start and never needs fsync
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=OFF")
+        self.db.execute("DROP TABLE IF EXISTS sessions")
+        self.db.execute("CREATE TABLE sessions (id INTEGER PRIMARY KEY, data BLOB)")
+
+    def save(self, key, player, game_state):
+        self.db.execute("INSERT OR REPLACE INTO sessions VALUES (?, ?)", (key, pack_session(player, game_state)))
+
+    def peek(self, key):
+        row = self.db.execute("SELECT data FROM sessions WHERE id = ?", (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def load(self, key, out=None):
+        data = self.peek(key)
+        self.db.execute("DELETE FROM sessions WHERE id = ?", (key,))
+        return unpack_session(data, out)
+
+    def discard(self, key):
+        self.db.execute("DELETE FROM sessions WHERE id = ?", (key,))
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+
+# -----------------------------
+# Hibernation
+# -----------------------------
+class Hibernator:
+    # Keeps the most recently used games in memory and puts the rest to sleep in the store.
+    # Sessions only need id, out, player and game_state, player is None while asleep
+    def __init__(self, store, max_awake=10000):
+        self.store = store
+        self.max_awake = max_awake
+        self.awake = OrderedDict()  # id -> session, least recently used first
+
+    def touch(self, session):
+        if session.player is None:
+            session.player, session.game_state = self.store.load(session.id, session.out)
+        self.awake[session.id] = session
+        self.awake.move_to_end(session.id)
+        while len(self.awake) > self.max_awake:
+            key, idle = self.awake.popitem(last=False)
+            self.store.save(key, idle.player, idle.game_state)
+            idle.player = idle.game_state = None
+
+    def forget(self, session):
+        if self.awake.pop(session.id, None) is None:
+            self.store.discard(session.id)
+
+    @property
+    def asleep(self):
+        return len(self.store)
@@ -0,0 +1,229 @@
+import asyncio
+import os
+import struct
+import threading
+import zlib
+
+from main import NULL_SINK, handle_command, setup_game
+from replay import decode_commands, encode_commands, pack_session, unpack_session
+from snapshot import FLAGS
+
+
+# -----------------------------
+# Record Format
+# -----------------------------
+# length, crc32 of everything after it, kind, session id, then the payload.
+# A crash can only tear the last record, recovery stops at the first one that doesn't check out
+FRAME = struct.Struct("<II")
+HEAD = struct.Struct("<BQ")
+
+START = 1       # payload: recording flag, seed
+COMMAND = 2     # payload: effects, then the command as replay tokens
+END = 3         # no payload
+CHECKPOINT = 4  # payload: a packed session
+
+SEED = struct.Struct("<BQ")
+EFFECTS = struct.Struct("<bHH")  # steps left, inventory bits, flag bits after the command
+
+BATCH_INTERVAL = 0.005      # seconds a batch waits for more records before its fsync
+COMPACT_BYTES = 64 * 2 ** 20  # journal size that triggers a rewrite as checkpoints
+
+
+def pack_record(kind, key, payload=b""):
+    body = HEAD.pack(kind, key) + payload
+    return FRAME.pack(len(body), zlib.crc32(body)) + body
+
+
+def read_records(data):
+    # (kind, session id, payload) for every intact record, then where the good data ends
+    position = 0
+    records = []
+    while position + FRAME.size <= len(data):
+        length, crc = FRAME.unpack_from(data, position)
+        body = data[position + FRAME.size:position + FRAME.size + length]
+        if length < HEAD.size or len(body) != length or zlib.crc32(body) != crc:
+            break
+        kind, key = HEAD.unpack_from(body)
+        records.append((kind, key, body[HEAD.size:]))
+        position += FRAME.size + length
+    return records, position
+
+
+def effects(player, game_state):
+    flags = 0
+    for bit, flag in enumerate(FLAGS):
+        if getattr(game_state, flag):
+            flags |= 1 << bit
+    return EFFECTS.pack(max(-128, min(127, player.steps)), player.inventory.bits, flags)
+
+
+# -----------------------------
+# Journal
+# -----------------------------
+class Journal:
+    # Appends are buffered in memory, sync() waits for the batch holding them to reach the disk.
+    # Every session waiting in the same batch shares one write and one fsync
+    def __init__(self, path, checkpoints=None, interval=BATCH_INTERVAL, compact_bytes=COMPACT_BYTES):
+        self.path = path
+        self.checkpoints = checkpoints  # callable giving (session id, packed session) for every live game
+        self.interval = interval
+        self.compact_bytes = compact_bytes
+        self.pending = bytearray()
+        self.waiters = []
+        self.writer = None
+        # Held for every write to the file, so close() waits for one still running in the executor
+        self.lock = threading.Lock()
+        self.file = open(path, "ab")
+        self.size = self.file.tell()
+
+    # --- Appending ---
+    def start(self, key, player, game_state):
+        self.pending += pack_record(START, key, SEED.pack(game_state.log is not None, game_state.seed))
+
+    def command(self, key, command, player, game_state):
+        self.pending += pack_record(COMMAND, key, effects(player, game_state) + encode_commands([command]))
+
+    def end(self, key):
+        self.pending += pack_record(END, key)
+
+    # --- Group Commit ---
+    async def sync(self):
+        if not self.pending:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        if self.writer is None:
+            self.writer = asyncio.create_task(self.run())
+        await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self.waiters:
+                # Let the batch fill up, then everything that arrived goes out together
+                await asyncio.sleep(self.interval)
+                waiters, self.waiters = self.waiters, []
+                try:
+                    if self.checkpoints and self.size >= self.compact_bytes:
+                        self.compact()
+                    else:
+                        data, self.pending = bytes(self.pending), bytearray()
+                        # Off the event loop, so the next batch keeps filling while this one is written
+                        await loop.run_in_executor(None, self.write, data)
+                except OSError as error:
+                    # The batch never reached the disk, its sessions are told instead of left waiting
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_exception(error)
+                    continue
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+        finally:
+            self.writer = None
+
+    def write(self, data):
+        with self.lock:
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.size += len(data)
+
+    def flush(self):
+        # For shutdown, write whatever is left without waiting for a batch
+        if self.pending:
+            data, self.pending = bytes(self.pending), bytearray()
+            self.write(data)
+
+    # --- Compaction ---
+    def compact(self):
+        # Every live game as one checkpoint, this already covers anything still pending
+        records = bytearray()
+        for key, data in self.checkpoints():
+            records += pack_record(CHECKPOINT, key, data)
+        temp = f"{self.path}.compact"
+        with self.lock:
+            with open(temp, "wb") as f:
+                f.write(records)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp, self.path)
+            directory = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+            self.file.close()
+            self.file = open(self.path, "ab")
+            self.pending.clear()
+            self.size = len(records)
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.file.close()
+
+
+# -----------------------------
+# Recovery
+# -----------------------------
+def recover(path):
+    # Rebuilds every game that hadn't ended, returns {session id: packed session} and the ids
+    # whose replayed effects didn't match what was journaled
+    if not os.path.exists(path):
+        return {}, []
+    with open(path, "rb") as f:
+        data = f.read()
+    records, good = read_records(data)
+    if good < len(data):
+        # Drop the torn tail so new records don't land behind garbage
+        with open(path, "r+b") as f:
+            f.truncate(good)
+
+    games = {}
+    diverged = set()
+    for kind, key, payload in records:
+        try:
+            if kind == START:
+                recording, seed = SEED.unpack(payload)
+                player, game_state = setup_game(seed, record=bool(recording), out=NULL_SINK)
+                player.location.enter(player, game_state)
+                games[key] = (player, game_state)
+                diverged.discard(key)
+            elif kind == CHECKPOINT:
+                games[key] = unpack_session(payload, NULL_SINK)
+                diverged.discard(key)
+            elif kind == COMMAND and key in games:
+                player, game_state = games[key]
+                for command in decode_commands(payload[EFFECTS.size:]):
+                    handle_command(player, game_state, command)
+                if effects(player, game_state) != payload[:EFFECTS.size]:
+                    diverged.add(key)
+            elif kind == END:
+                games.pop(key, None)
+                diverged.discard(key)
+        except Exception:
+            # One record that can't be replayed costs only its own game, never the whole restart
+            if kind == CHECKPOINT:
+                games.pop(key, None)
+            diverged.add(key)
+    return {key: pack_session(*game) for key, game in games.items()}, sorted(diverged)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect a server journal.")
+    parser.add_argument("journal")
+    args = parser.parse_args()
+
+    with open(args.journal, "rb") as f:
+        data = f.read()
+    records, good = read_records(data)
+    counts = {}
+    for kind, key, payload in records:
+        counts[kind] = counts.get(kind, 0) + 1
+    names = {START: "start", COMMAND: "command", END: "end", CHECKPOINT: "checkpoint"}
+    print(f"{len(records)} records, {good:,} good bytes, {len(data) - good:,} torn")
+    for kind, count in sorted(counts.items()):
+        print(f"  {names.get(kind, kind)}: {count}")
@@ -0,0 +1,314 @@
+import json
+import mmap
+import os
+import struct
+import zlib
+from collections import namedtuple
+from collections.abc import Mapping
+from types import MappingProxyType
+
+DIRECTIONS = ("forward", "back", "left", "right")
+
+
+# -----------------------------
+# Room Templates (shared by every game)
+# -----------------------------
+RoomTemplate = namedtuple("RoomTemplate", "index color_name actual_name description exits items hidden variants")
+
+
+def room_template(index, color_name, actual_name, description, exits, items=(), hidden=None, variants=None):
+    # Templates are never mutated, so one copy can back every game
+    # index: the room's id, hidden: exits a puzzle can open later, variants: descriptions a puzzle can switch to
+    return RoomTemplate(index, color_name, actual_name, description, MappingProxyType(exits), tuple(items),
+                        MappingProxyType(hidden or {}), MappingProxyType(variants or {}))
+
+
+# -----------------------------
+# Compiled Format
+# -----------------------------
+# A mansion compiles to one flat little-endian file: a header of counts and section offsets,
+# fixed-size room records, exit and item arrays holding integer ids, every piece of text
+# interned once in a string table, and a hash table from room name to room id.
+# Nothing is decoded until a room is first asked for.
+MAGIC = b"MNSN"
+FORMAT = 2
+
+# magic, format, source mtime, source size, rooms, items, start room, strings, name index slots,
+# then where the rooms, item names, room items, exits, variants, string offsets, string data and name index begin
+HEADER = struct.Struct("<4sHqqIHIII8I")
+# name, color, description, where its items, exits and variants start, then how many items, exits,
+# hidden exits (stored right after the exits) and variants it has
+ROOM = struct.Struct("<6I4B")
+EXIT = struct.Struct("<I")       # target room << 2 | direction
+VARIANT = struct.Struct("<II")   # key, text
+STRING = struct.Struct("<I")
+SLOT = struct.Struct("<I")       # room id + 1, 0 for an empty slot
+
+MAX_ROOMS = 1 << 30
+MAX_ITEMS = 255
+CACHE_SIZE = 8192  # decoded rooms and strings kept around, oldest dropped first
+
+
+def validate(data):
+    errors = []
+    rooms = data.get("rooms") or []
+    items = data.get("items") or []
+    names = [room.get("name") for room in rooms]
+    known = set(names)
+    if not rooms:
+        errors.append("A mansion needs at least one room")
+    if len(rooms) > MAX_ROOMS or len(items) > MAX_ITEMS:
+        errors.append(f"A mansion holds at most {MAX_ROOMS} rooms and {MAX_ITEMS} items")
+    if len(set(items)) != len(items):
+        errors.append("Items must be listed once each")
+    if data.get("start") not in known:
+        errors.append(f"Start room {data.get('start')!r} doesn't exist")
+
+    seen = set()
+    placed = {}
+    for number, room in enumerate(rooms):
+        name = room.get("name")
+        label = name or f"room #{number}"
+        for field in ("name", "color", "description"):
+            if not isinstance(room.get(field), str) or not room.get(field):
+                errors.append(f"{label}: {field} must be a non-empty string")
+        if name in seen:
+            errors.append(f"{label}: listed more than once")
+        seen.add(name)
+        for field in ("exits", "hidden"):
+            for direction, target in room.get(field, {}).items():
+                if direction not in DIRECTIONS:
+                    errors.append(f"{label}: {direction!r} isn't a direction")
+                if target not in known:
+                    errors.append(f"{label}: {field} {direction} leads to unknown room {target!r}")
+        for direction in room.get("hidden", {}):
+            if direction in room.get("exits", {}):
+                errors.append(f"{label}: hidden exit {direction} is already an exit")
+        for item in room.get("items", []):
+            if item not in items:
+                errors.append(f"{label}: item {item!r} isn't in the item list")
+            elif item in placed:
+                errors.append(f"{label}: item {item!r} is already in {placed[item]}")
+            placed[item] = label
+        for key, text in room.get("variants", {}).items():
+            if not isinstance(text, str):
+                errors.append(f"{label}: variant {key!r} must be a string")
+    if errors:
+        raise ValueError("Invalid mansion:\n  " + "\n  ".join(errors))
+
+
+def compile_mansion(data, mtime=0, size=0):
+    validate(data)
+    strings = {}
+
+    def intern(text):
+        return strings.setdefault(text, len(strings))
+
+    rooms = data["rooms"]
+    items = data["items"]
+    room_ids = {room["name"]: index for index, room in enumerate(rooms)}
+    item_ids = {item: index for index, item in enumerate(items)}
+
+    room_records = bytearray()
+    room_items = bytearray()
+    exits = bytearray()
+    variants = bytearray()
+    for room in rooms:
+        room_exits = list(room.get("exits", {}).items()) + list(room.get("hidden", {}).items())
+        room_variants = room.get("variants", {})
+        room_records += ROOM.pack(
+            intern(room["name"]), intern(room["color"]), intern(room["description"]),
+            len(room_items), len(exits) // EXIT.size, len(variants) // VARIANT.size,
+            len(room.get("items", [])), len(room.get("exits", {})), len(room.get("hidden", {})), len(room_variants))
+        room_items += bytes(item_ids[item] for item in room.get("items", []))
+        for direction, target in room_exits:
+            exits += EXIT.pack(room_ids[target] << 2 | DIRECTIONS.index(direction))
+        for key, text in room_variants.items():
+            variants += VARIANT.pack(intern(key), intern(text))
+    item_names = b"".join(STRING.pack(intern(item)) for item in items)
+
+    encoded = [text.encode("utf-8") for text in strings]
+    offsets = [0]
+    for text in encoded:
+        offsets.append(offsets[-1] + len(text))
+    string_offsets = struct.pack(f"<{len(offsets)}I", *offsets)
+
+    # Open addressing, at most three quarters full so probes stay short
+    slots = 1 << max(1, (len(rooms) * 4 // 3).bit_length())
+    table = [0] * slots
+    for index, room in enumerate(rooms):
+        slot = zlib.crc32(room["name"].encode("utf-8")) & (slots - 1)
+        while table[slot]:
+            slot = (slot + 1) & (slots - 1)
+        table[slot] = index + 1
+    name_index = struct.pack(f"<{slots}I", *table)
+
+    sections = [room_records, item_names, room_items, exits, variants, string_offsets, b"".join(encoded),
+                name_index]
+    starts = []
+    position = HEADER.size
+    for section in sections:
+        starts.append(position)
+        position += len(section)
+    header = HEADER.pack(MAGIC, FORMAT, mtime, size, len(rooms), len(items), room_ids[data["start"]],
+                         len(strings), slots, *starts)
+    return header + b"".join(sections)
+
+
+# -----------------------------
+# Loading
+# -----------------------------
+class CompiledMansion(Mapping):
+    # Room name -> RoomTemplate, read straight out of the compiled bytes (usually an mmap).
+    # Only recently asked for rooms are kept decoded, so a huge mansion costs little more than its file
+    def __init__(self, buffer):
+        (magic, version, mtime, size, self.room_count, self.item_count, self.start_index, string_count,
+         self.slots, self.rooms_at, self.item_names_at, self.room_items_at, self.exits_at, self.variants_at,
+         self.string_offsets_at, self.strings_at, self.name_index_at) = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != FORMAT:
+            raise ValueError("Not a compiled mansion of this format")
+        self.buffer = buffer
+        self.strings = {}    # string id -> text
+        self.templates = {}  # room name -> RoomTemplate
+        self.item_names = tuple(self.string(number) for number in
+                                struct.unpack_from(f"<{self.item_count}I", buffer, self.item_names_at))
+
+    def raw_string(self, number):
+        start, end = struct.unpack_from("<II", self.buffer, self.string_offsets_at + number * STRING.size)
+        return self.buffer[self.strings_at + start:self.strings_at + end]
+
+    def string(self, number):
+        text = self.strings.get(number)
+        if text is None:
+            if len(self.strings) >= CACHE_SIZE:
+                del self.strings[next(iter(self.strings))]
+            text = self.strings[number] = str(self.raw_string(number), "utf-8")
+        return text
+
+    def record(self, index):
+        return ROOM.unpack_from(self.buffer, self.rooms_at + index * ROOM.size)
+
+    def name(self, index):
+        return self.string(self.record(index)[0])
+
+    def find(self, name):
+        # The room id for a name, through the hash table so it costs the same in any size of mansion
+        encoded = name.encode("utf-8")
+        mask = self.slots - 1
+        slot = zlib.crc32(encoded) & mask
+        while True:
+            entry, = SLOT.unpack_from(self.buffer, self.name_index_at + slot * SLOT.size)
+            if not entry:
+                raise KeyError(name)
+            if self.raw_string(self.record(entry - 1)[0]) == encoded:
+                return entry - 1
+            slot = (slot + 1) & mask
+
+    def exit_map(self, start, count):
+        exits = {}
+        for position in range(start, start + count):
+            packed, = EXIT.unpack_from(self.buffer, self.exits_at + position * EXIT.size)
+            exits[DIRECTIONS[packed & 0b11]] = self.name(packed >> 2)
+        return exits
+
+    def template(self, index):
+        (name, color, description, items_at, exits_at, variants_at, item_count, exit_count, hidden_count,
+         variant_count) = self.record(index)
+        items = [self.item_names[item] for item in self.buffer[self.room_items_at + items_at:
+                                                          self.room_items_at + items_at + item_count]]
+        variants = {}
+        for position in range(variants_at, variants_at + variant_count):
+            key, text = VARIANT.unpack_from(self.buffer, self.variants_at + position * VARIANT.size)
+            variants[self.string(key)] = self.string(text)
+        return room_template(
+            index, self.string(color), self.string(name), self.string(description), self.exit_map(exits_at, exit_count),
+            items, self.exit_map(exits_at + exit_count, hidden_count), variants)
+
+    @property
+    def start(self):
+        return self.name(self.start_index)
+
+    def __getitem__(self, name):
+        template = self.templates.get(name)
+        if template is None:
+            if len(self.templates) >= CACHE_SIZE:
+                del self.templates[next(iter(self.templates))]
+            template = self.templates[name] = self.template(self.find(name))
+        return template
+
+    def __iter__(self):
+        return (self.name(index) for index in range(self.room_count))
+
+    def __len__(self):
+        return self.room_count
+
+
+def cache_path(path):
+    # Beside the source like a .pyc, so it's rebuilt whenever the data file changes
+    directory, filename = os.path.split(path)
+    return os.path.join(directory, "__pycache__", f"{filename}.compiled")
+
+
+def read_compiled(path, source):
+    # The cached build if it's still current, mapped rather than read so every process shares the pages
+    try:
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    if (len(buffer) < HEADER.size
+            or HEADER.unpack_from(buffer)[:4] != (MAGIC, FORMAT, source.st_mtime_ns, source.st_size)):
+        buffer.close()
+        return None
+    return buffer
+
+
+def build(path):
+    source = os.stat(path)
+    cache = cache_path(path)
+    buffer = read_compiled(cache, source)
+    if buffer is not None:
+        return buffer
+
+    with open(path, encoding="utf-8") as f:
+        buffer = compile_mansion(json.load(f), source.st_mtime_ns, source.st_size)
+    try:
+        os.makedirs(os.path.dirname(cache), exist_ok=True)
+        temp = f"{cache}.{os.getpid()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(buffer)
+        os.replace(temp, cache)
+    except OSError:
+        pass  # a read-only checkout still works, it just compiles every start
+    return buffer
+
+
+_loaded = {}
+
+
+def load_mansion(path):
+    # One CompiledMansion per data file for the whole process, every game reads from it
+    path = os.path.abspath(path)
+    mansion = _loaded.get(path)
+    if mansion is None:
+        mansion = _loaded[path] = CompiledMansion(build(path))
+    return mansion
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Check and compile mansion data files.")
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    for path in args.paths:
+        start = time.perf_counter()
+        try:
+            mansion = CompiledMansion(build(path))
+        except ValueError as error:
+            raise SystemExit(f"{path}: {error}")
+        elapsed = time.perf_counter() - start
+        print(f"{path}: {len(mansion)} rooms, {len(mansion.item_names)} items, "
+              f"{len(mansion.buffer):,} bytes compiled, loaded in {elapsed * 1000:.2f} ms")
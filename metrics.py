@@ -0,0 +1,229 @@
+import os
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+import main
+import solver
+
+
+# Upper bounds in seconds, the last bucket (+Inf) catches everything slower
+BUCKETS = (1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 1e-3, 1e-2)
+BUCKETS_NS = tuple(round(bound * 1e9) for bound in BUCKETS)
+
+HELP = {
+    "mansion_command_seconds": ("histogram", "Time to run one command, by command and the room it was typed in."),
+    "mansion_room_enter_seconds": ("histogram", "Time spent in Room.enter, including entrance triggers."),
+    "mansion_events_total": ("counter", "Random and scripted events that fired, by event and room."),
+    "mansion_unknown_commands_total": ("counter", "Commands that didn't match any verb."),
+}
+
+
+# -----------------------------
+# Registry
+# -----------------------------
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_NS) + 1)
+        self.total = 0
+
+    def observe(self, ns):
+        self.counts[bisect_left(BUCKETS_NS, ns)] += 1
+        self.total += ns
+
+
+class Registry:
+    def __init__(self):
+        self.histograms = defaultdict(lambda: defaultdict(Histogram))  # name -> labels -> Histogram
+        self.counters = defaultdict(lambda: defaultdict(int))          # name -> labels -> count
+
+    def observe(self, name, labels, ns):
+        self.histograms[name][labels].observe(ns)
+
+    def inc(self, name, labels=()):
+        self.counters[name][labels] += 1
+
+    def clear(self):
+        self.histograms.clear()
+        self.counters.clear()
+
+    def render(self):
+        lines = []
+        for name, series in self.histograms.items():
+            header(lines, name)
+            for labels, histogram in sorted(series.items()):
+                running = 0
+                for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                    running += count
+                    lines.append(f"{name}_bucket{label_text(labels + (('le', str(bound)),))} {running}")
+                lines.append(f"{name}_sum{label_text(labels)} {histogram.total / 1e9:.9f}")
+                lines.append(f"{name}_count{label_text(labels)} {running}")
+        for name, series in self.counters.items():
+            header(lines, name)
+            for labels, count in sorted(series.items()):
+                lines.append(f"{name}{label_text(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        # Write then rename so a scraper never reads half a snapshot
+        temp = f"{path}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(temp, path)
+
+
+def header(lines, name):
+    kind, text = HELP[name]
+    lines.append(f"# HELP {name} {text}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def label_text(labels):
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"') for key, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+REGISTRY = Registry()
+
+
+# -----------------------------
+# Instrumented Wrappers
+# -----------------------------
+def timed_command(name, handler, registry, current):
+    clock = time.perf_counter_ns
+
+    def command(player, game_state, target):
+        if current["muted"]:
+            return handler(player, game_state, target)
+        room = current["room"] = player.location.actual_name
+        start = clock()
+        try:
+            return handler(player, game_state, target)
+        finally:
+            registry.observe("mansion_command_seconds", (("command", name), ("room", room)), clock() - start)
+    return command
+
+
+def timed_answer(name, answer, registry, current):
+    clock = time.perf_counter_ns
+
+    def puzzle_answer(game_state, player, text):
+        if current["muted"]:
+            return answer(game_state, player, text)
+        room = player.location.actual_name
+        start = clock()
+        try:
+            return answer(game_state, player, text)
+        finally:
+            registry.observe("mansion_command_seconds", (("command", f"{name} answer"), ("room", room)), clock() - start)
+    return puzzle_answer
+
+
+def instrumented(original, registry, current):
+    # Each event is counted by the state change it leaves behind, so the game code stays untouched.
+    # ambient_event isn't told the room, so it uses the one the running command was typed in.
+    # Nothing is recorded while muted, that's the solver playing games of its own
+    clock = time.perf_counter_ns
+
+    def enter(self, player, game_state):
+        if current["muted"]:
+            return original["enter"](self, player, game_state)
+        start = clock()
+        try:
+            return original["enter"](self, player, game_state)
+        finally:
+            registry.observe("mansion_room_enter_seconds", (("room", self.actual_name),), clock() - start)
+
+    def ambient_event(game_state):
+        # An empty pool is refilled before the roll, an event then leaves one short of a full pool
+        before = len(game_state.ambient_pool) or len(main.AMBIENT_EVENTS)
+        original["ambient_event"](game_state)
+        if len(game_state.ambient_pool) < before and not current["muted"]:
+            registry.inc("mansion_events_total", (("event", "ambient"), ("room", current["room"])))
+
+    def major_scare_event(player, game_state):
+        before = game_state.scares
+        original["major_scare_event"](player, game_state)
+        if game_state.scares != before and not current["muted"]:
+            registry.inc("mansion_events_total", (("event", "major_scare"), ("room", player.location.actual_name)))
+
+    def trap_event(player, game_state):
+        room = player.location
+        original["trap_event"](player, game_state)
+        if player.location is not room and not current["muted"]:
+            registry.inc("mansion_events_total", (("event", "trap"), ("room", room.actual_name)))
+
+    def pop_balloon(game_state, player):
+        before = game_state.blue_button_found
+        original["pop_balloon"](game_state, player)
+        if game_state.blue_button_found and not before and not current["muted"]:
+            registry.inc("mansion_events_total", (("event", "blue_button_drop"), ("room", player.location.actual_name)))
+
+    def parse_command(command):
+        handler, target = original["parse_command"](command)
+        if handler is None and not current["muted"]:
+            registry.inc("mansion_unknown_commands_total")
+        return handler, target
+
+    def best_action(player, game_state):
+        current["muted"] += 1
+        try:
+            return original["best_action"](player, game_state)
+        finally:
+            current["muted"] -= 1
+
+    return {"ambient_event": ambient_event, "major_scare_event": major_scare_event, "trap_event": trap_event,
+            "pop_balloon": pop_balloon, "parse_command": parse_command, "enter": enter, "best_action": best_action}
+
+
+# -----------------------------
+# Switch
+# -----------------------------
+# Disabled means the original functions are back in place, so there's no cost at all
+EVENT_FUNCTIONS = ("ambient_event", "major_scare_event", "trap_event", "pop_balloon", "parse_command")
+_installed = None
+
+
+def enable(registry=REGISTRY):
+    global _installed
+    if _installed:
+        return
+    original = {name: getattr(main, name) for name in EVENT_FUNCTIONS}
+    original["enter"] = main.Room.enter
+    original["best_action"] = solver.best_action
+    original["commands"] = dict(main.COMMANDS)
+    original["answers"] = dict(main.PUZZLE_ANSWERS)
+
+    current = {"room": "", "muted": 0}
+    for name, wrapper in instrumented(original, registry, current).items():
+        if name == "enter":
+            main.Room.enter = wrapper
+        elif name == "best_action":
+            solver.best_action = wrapper
+        else:
+            setattr(main, name, wrapper)
+    for name, (handler, takes_object) in original["commands"].items():
+        main.COMMANDS[name] = (timed_command(name, handler, registry, current), takes_object)
+    for name, answer in original["answers"].items():
+        main.PUZZLE_ANSWERS[name] = timed_answer(name, answer, registry, current)
+    _installed = original
+
+
+def disable():
+    global _installed
+    if not _installed:
+        return
+    original = _installed
+    for name in EVENT_FUNCTIONS:
+        setattr(main, name, original[name])
+    main.Room.enter = original["enter"]
+    solver.best_action = original["best_action"]
+    main.COMMANDS.update(original["commands"])
+    main.PUZZLE_ANSWERS.update(original["answers"])
+    _installed = None
+
+
+def enabled():
+    return _installed is not None
@@ -0,0 +1,327 @@
+import heapq
+import json
+import math
+import os
+
+from main import Player
+
+
+STARTING_STEPS = Player(None).steps
+SCARE_STEPS = 3
+WRONG_ANSWER_STEPS = 5
+LEADERBOARD_SIZE = 10
+
+RESULTS = ("won", "out of steps", "caught by the clown", "quit", "unfinished")
+CAUSES = ("scares", "color puzzle", "graveyard puzzle")
+
+
+# -----------------------------
+# Sketches
+# -----------------------------
+class QuantileSketch:
+    # Log-spaced buckets, so every quantile is within `accuracy` of the true value (relative).
+    # Memory is capped at max_buckets, past that the lowest buckets fold together. Merging adds counts
+    def __init__(self, accuracy=0.01, max_buckets=1024):
+        self.accuracy = accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = {}  # bucket -> count
+        self.negative = {}
+        self.zeros = 0
+        self.count = 0
+
+    def bucket(self, value):
+        return math.ceil(math.log(value) / self.log_gamma)
+
+    def value(self, bucket):
+        # The middle of the bucket, which is what keeps the error relative
+        return 2 * self.gamma ** bucket / (1 + self.gamma)
+
+    def add(self, value, count=1):
+        if value > 0:
+            buckets = self.positive
+        elif value < 0:
+            buckets, value = self.negative, -value
+        else:
+            self.zeros += count
+            self.count += count
+            return
+        key = self.bucket(value)
+        buckets[key] = buckets.get(key, 0) + count
+        self.count += count
+        if len(buckets) > self.max_buckets:
+            self.collapse(buckets)
+
+    def collapse(self, buckets):
+        # The smallest magnitudes lose their precision first
+        keys = sorted(buckets)
+        spare = keys[:len(keys) - self.max_buckets + 1]
+        buckets[spare[-1]] = sum(buckets.pop(key) for key in spare[:-1]) + buckets[spare[-1]]
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self.value(key)
+        seen += self.zeros
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self.value(key)
+        return self.value(max(self.positive))
+
+    def merge(self, other):
+        if other.accuracy != self.accuracy:
+            raise ValueError("Only sketches with the same accuracy can be merged")
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in theirs.items():
+                mine[key] = mine.get(key, 0) + count
+            if len(mine) > self.max_buckets:
+                self.collapse(mine)
+        self.zeros += other.zeros
+        self.count += other.count
+
+    def to_dict(self):
+        return {"accuracy": self.accuracy, "max_buckets": self.max_buckets, "zeros": self.zeros,
+                "positive": sorted(self.positive.items()), "negative": sorted(self.negative.items())}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data["accuracy"], data["max_buckets"])
+        sketch.positive = {key: count for key, count in data["positive"]}
+        sketch.negative = {key: count for key, count in data["negative"]}
+        sketch.zeros = data["zeros"]
+        sketch.count = sketch.zeros + sum(sketch.positive.values()) + sum(sketch.negative.values())
+        return sketch
+
+
+class IntHistogram:
+    # One bucket per whole number from low to high, anything outside lands in the end buckets
+    def __init__(self, low, high):
+        self.low = low
+        self.counts = [0] * (high - low + 1)
+
+    def add(self, value, count=1):
+        self.counts[min(max(value - self.low, 0), len(self.counts) - 1)] += count
+
+    def merge(self, other):
+        if (other.low, len(other.counts)) != (self.low, len(self.counts)):
+            raise ValueError("Only histograms with the same range can be merged")
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+
+    def items(self):
+        return [(self.low + index, count) for index, count in enumerate(self.counts) if count]
+
+    def to_dict(self):
+        return {"low": self.low, "counts": self.counts}
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["low"], data["low"] + len(data["counts"]) - 1)
+        histogram.counts = list(data["counts"])
+        return histogram
+
+
+class Leaderboard:
+    # The best few games: most steps left, then fewest turns
+    def __init__(self, size=LEADERBOARD_SIZE):
+        self.size = size
+        self.entries = []  # min-heap of (steps, -turns, seed)
+
+    def add(self, steps, turns, seed):
+        entry = (steps, -turns, seed)
+        if len(self.entries) < self.size:
+            heapq.heappush(self.entries, entry)
+        elif entry > self.entries[0]:
+            heapq.heapreplace(self.entries, entry)
+
+    def merge(self, other):
+        self.entries = heapq.nlargest(self.size, self.entries + other.entries)
+        heapq.heapify(self.entries)
+
+    def top(self):
+        return [(steps, -turns, seed) for steps, turns, seed in sorted(self.entries, reverse=True)]
+
+    def to_dict(self):
+        return {"size": self.size, "entries": self.top()}
+
+    @classmethod
+    def from_dict(cls, data):
+        board = cls(data["size"])
+        for steps, turns, seed in data["entries"]:
+            board.add(steps, turns, seed)
+        return board
+
+
+# -----------------------------
+# Outcome Stats
+# -----------------------------
+def result(player, game_state):
+    if game_state.won:
+        return "won"
+    if player.location.actual_name == "Ringmaster’s Chamber":
+        return "caught by the clown"
+    if player.steps <= 0:
+        return "out of steps"
+    if game_state.end:
+        return "quit"
+    # Still going when it was cut off, e.g. by simulate.py's --max-turns
+    return "unfinished"
+
+
+def steps_lost(game_state):
+    return {
+        "scares": game_state.scares * SCARE_STEPS,
+        "color puzzle": game_state.color_misses * WRONG_ANSWER_STEPS,
+        "graveyard puzzle": game_state.grave_misses * WRONG_ANSWER_STEPS,
+    }
+
+
+class OutcomeStats:
+    # Every finished game folds into fixed-size counters, histograms and sketches,
+    # so memory stays the same after a million games as after one
+    def __init__(self):
+        self.results = dict.fromkeys(RESULTS, 0)
+        self.steps_lost = dict.fromkeys(CAUSES, 0)   # total over every game
+        self.fatal = dict.fromkeys(CAUSES, 0)        # deaths that wouldn't have run out of steps without it
+        self.steps_left = IntHistogram(-20, STARTING_STEPS)
+        self.scares = IntHistogram(0, 20)
+        self.turns = QuantileSketch()
+        self.winning_turns = QuantileSketch()
+        self.leaderboard = Leaderboard()
+
+    @property
+    def games(self):
+        return sum(self.results.values())
+
+    def add(self, player, game_state):
+        outcome = result(player, game_state)
+        self.results[outcome] += 1
+        if outcome == "unfinished":
+            # Its steps and turns only say where the cut-off fell, not how the game went
+            return
+        lost = steps_lost(game_state)
+        for cause, steps in lost.items():
+            self.steps_lost[cause] += steps
+            if outcome != "won" and player.steps <= 0 < player.steps + steps:
+                self.fatal[cause] += 1
+        self.steps_left.add(player.steps)
+        self.scares.add(game_state.scares)
+        self.turns.add(game_state.turns)
+        if outcome == "won":
+            self.winning_turns.add(game_state.turns)
+            self.leaderboard.add(player.steps, game_state.turns, game_state.seed)
+
+    def merge(self, other):
+        for mine, theirs in ((self.results, other.results), (self.steps_lost, other.steps_lost),
+                             (self.fatal, other.fatal)):
+            for key, count in theirs.items():
+                mine[key] += count
+        self.steps_left.merge(other.steps_left)
+        self.scares.merge(other.scares)
+        self.turns.merge(other.turns)
+        self.winning_turns.merge(other.winning_turns)
+        self.leaderboard.merge(other.leaderboard)
+        return self
+
+    # --- Queries ---
+    def percentiles(self, name, qs=(0.5, 0.9, 0.99)):
+        sketch = getattr(self, name)
+        return {q: sketch.quantile(q) for q in qs}
+
+    def costliest(self):
+        # The cause that took the most steps overall
+        return max(self.steps_lost, key=self.steps_lost.get)
+
+    def summary(self):
+        games = self.games
+        return {
+            "games": games,
+            "results": self.results,
+            "win rate": self.results["won"] / games if games else None,
+            "steps lost": self.steps_lost,
+            "fatal": self.fatal,
+            "costliest": self.costliest() if games else None,
+            "turns": self.percentiles("turns"),
+            "winning turns": self.percentiles("winning_turns"),
+            "leaderboard": self.leaderboard.top(),
+        }
+
+    # --- Dumps ---
+    def to_dict(self):
+        return {
+            "results": self.results, "steps_lost": self.steps_lost, "fatal": self.fatal,
+            "steps_left": self.steps_left.to_dict(), "scares": self.scares.to_dict(),
+            "turns": self.turns.to_dict(), "winning_turns": self.winning_turns.to_dict(),
+            "leaderboard": self.leaderboard.to_dict(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        stats.results.update(data["results"])
+        stats.steps_lost.update(data["steps_lost"])
+        stats.fatal.update(data["fatal"])
+        stats.steps_left = IntHistogram.from_dict(data["steps_left"])
+        stats.scares = IntHistogram.from_dict(data["scares"])
+        stats.turns = QuantileSketch.from_dict(data["turns"])
+        stats.winning_turns = QuantileSketch.from_dict(data["winning_turns"])
+        stats.leaderboard = Leaderboard.from_dict(data["leaderboard"])
+        return stats
+
+    def write(self, path):
+        # Write then rename, like the metrics file, so a reader never sees half a dump
+        temp = f"{path}.tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f)
+        os.replace(temp, path)
+
+
+def load(paths):
+    # Several dumps, from different processes or machines, as one
+    stats = OutcomeStats()
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            stats.merge(OutcomeStats.from_dict(json.load(f)))
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query outcome dumps from the server or simulate.py.")
+    parser.add_argument("dumps", nargs="+", help="dump files, merged before reporting")
+    parser.add_argument("--percentile", type=float, action="append",
+                        help="report this turn percentile (0-100), can be repeated")
+    parser.add_argument("--json", action="store_true", help="print the merged dump instead of a report")
+    args = parser.parse_args()
+
+    stats = load(args.dumps)
+    if args.json:
+        print(json.dumps(stats.to_dict()))
+        raise SystemExit
+    games = stats.games
+    print(f"Games:             {games:,}")
+    if not games:
+        raise SystemExit
+    for name, count in stats.results.items():
+        print(f"  {name:<21}{count:>10,} {count / games:8.2%}")
+    print("Steps lost (fatal losses):")
+    for cause, steps in stats.steps_lost.items():
+        print(f"  {cause:<21}{steps:>10,} ({stats.fatal[cause]:,})")
+    print(f"Costliest:         {stats.costliest()}")
+    qs = [value / 100 for value in args.percentile] if args.percentile else [0.5, 0.9, 0.99]
+    for name in ("turns", "winning_turns"):
+        text = ", ".join(f"p{q * 100:g} {value:.1f}" if value is not None else f"p{q * 100:g} -"
+                         for q, value in stats.percentiles(name, qs).items())
+        print(f"{name.replace('_', ' ').capitalize() + ':':<19}{text}")
+    print("Leaderboard:")
+    for place, (steps, turns, seed) in enumerate(stats.leaderboard.top(), 1):
+        print(f"  {place:>2}. {steps} steps left in {turns} turns (seed {seed})")
@@ -0,0 +1,151 @@
+import argparse
+import struct
+import time
+from itertools import permutations
+
+import snapshot
+from main import COMMANDS, DIRECTIONS, ITEMS, NULL_SINK, setup_game, handle_command
+from simulate import POLICIES, run_game
+
+
+# -----------------------------
+# Command Vocabulary
+# -----------------------------
+# Almost every command a player types is one of these, so a log costs about a byte per turn
+VOCABULARY = (
+    [f"go {direction}" for direction in DIRECTIONS]
+    + [f"{verb} {item}" for verb in ("take", "use") for item in ITEMS]
+    + [name for name, (handler, takes_object) in COMMANDS.items() if not takes_object]
+    + ["oldest", "middle", "youngest", "back"]
+    + [" ".join(code) for code in permutations(["red", "green", "blue", "yellow"])]
+)
+TOKENS = {command: index for index, command in enumerate(VOCABULARY)}
+ESCAPE = 255  # followed by a length byte and the raw command
+
+HEADER = struct.Struct("<Q")
+LENGTH = struct.Struct("<I")
+
+
+def encode_commands(commands):
+    data = bytearray()
+    for command in commands:
+        token = TOKENS.get(command)
+        if token is not None:
+            data.append(token)
+        else:
+            # Cut on a character boundary, half a character would never decode again
+            raw = command.encode()[:255].decode(errors="ignore").encode()
+            data += bytes((ESCAPE, len(raw))) + raw
+    return bytes(data)
+
+
+def decode_commands(data):
+    commands = []
+    position = 0
+    while position < len(data):
+        token = data[position]
+        if token == ESCAPE:
+            length = data[position + 1]
+            commands.append(data[position + 2:position + 2 + length].decode())
+            position += 2 + length
+        else:
+            commands.append(VOCABULARY[token])
+            position += 1
+    return commands
+
+
+# -----------------------------
+# Recordings
+# -----------------------------
+# seed, final snapshot, then the command tokens
+def encode(seed, commands, final):
+    return HEADER.pack(seed) + final + encode_commands(commands)
+
+
+def decode(data):
+    seed, = HEADER.unpack_from(data)
+    final = data[HEADER.size:HEADER.size + snapshot.SIZE]
+    return seed, decode_commands(data[HEADER.size + snapshot.SIZE:]), final
+
+
+def record(player, game_state):
+    return encode(game_state.seed, game_state.log, snapshot.save(player, game_state))
+
+
+# A live game between processes: a recording flag, then a recording of it so far
+def pack_session(player, game_state):
+    recording = game_state.log is not None
+    return bytes((recording,)) + encode(game_state.seed, game_state.log or [], snapshot.save(player, game_state))
+
+
+def unpack_session(data, out=None):
+    seed, commands, final = decode(data[1:])
+    player, game_state = snapshot.restore(final, out)
+    game_state.seed = seed
+    game_state.log = commands if data[0] else None
+    return player, game_state
+
+
+def replay(seed, commands):
+    player, game_state = setup_game(seed, out=NULL_SINK)
+    player.location.enter(player, game_state)
+    for command in commands:
+        handle_command(player, game_state, command)
+    return player, game_state
+
+
+# -----------------------------
+# Corpus Files
+# -----------------------------
+def write_corpus(path, recordings, mode="wb"):
+    with open(path, mode) as corpus:
+        for data in recordings:
+            corpus.write(LENGTH.pack(len(data)) + data)
+
+
+def read_corpus(path):
+    with open(path, "rb") as corpus:
+        data = corpus.read()
+    position = 0
+    while position < len(data):
+        length, = LENGTH.unpack_from(data, position)
+        position += LENGTH.size
+        yield data[position:position + length]
+        position += length
+
+
+def check_corpus(path):
+    games = 0
+    mismatches = []
+    start = time.perf_counter()
+    for data in read_corpus(path):
+        seed, commands, final = decode(data)
+        player, game_state = replay(seed, commands)
+        if snapshot.save(player, game_state) != final:
+            mismatches.append(seed)
+        games += 1
+    return games, mismatches, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record and replay game logs.")
+    parser.add_argument("action", choices=["record", "check"])
+    parser.add_argument("corpus")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="greedy")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.action == "record":
+        recordings = [record(*run_game(seed, args.policy, record=True)[:2])
+                      for seed in range(args.seed, args.seed + args.games)]
+        write_corpus(args.corpus, recordings)
+        total = sum(map(len, recordings))
+        print(f"Recorded {len(recordings)} games, {total / len(recordings):.1f} bytes per game")
+    else:
+        games, mismatches, elapsed = check_corpus(args.corpus)
+        print(f"Replayed {games} games in {elapsed:.2f}s ({games / elapsed:,.0f} games/sec)")
+        if mismatches:
+            print(f"{len(mismatches)} games diverged, first seeds: {mismatches[:10]}")
+            raise SystemExit(1)
+        print("All games matched their recorded final state.")
@@ -0,0 +1,304 @@
+import argparse
+import asyncio
+import contextlib
+import secrets
+import sys
+import traceback
+
+import metrics
+import solver
+from hibernate import SESSION_BYTES, Hibernator, SessionStore
+from journal import BATCH_INTERVAL, Journal, recover
+from main import SocketSink, check_mansion, setup_game, handle_command, prompt_text
+from mansion import load_mansion
+from outcomes import OutcomeStats
+from replay import pack_session, record, unpack_session, write_corpus
+
+
+MAX_LINE = 256            # longest command a client may send
+IDLE_TIMEOUT = 600        # seconds before an idle session is dropped
+WRITE_HIGH_WATER = 16384  # bytes buffered per connection before we wait on the client
+METRICS_INTERVAL = 15     # seconds between metrics snapshots
+BACKLOG = 1024            # connections the kernel queues while we're busy accepting
+
+CRASHED = b"\nSomething went wrong in the mansion, this game has to end. Sorry!\n"
+
+
+# -----------------------------
+# Session
+# -----------------------------
+class Session:
+    # Output is only buffered here, the server flushes it once the turn is safely journaled
+    def __init__(self, writer, recorder=None, mansion=None, hibernator=None, key=0, journal=None, outcomes=None):
+        self.id = key
+        self.out = SocketSink(writer)
+        self.recorder = recorder
+        self.outcomes = outcomes
+        self.mansion = mansion
+        self.hibernator = hibernator
+        self.journal = journal
+        self.reset()
+
+    def reset(self):
+        self.player, self.game_state = setup_game(record=self.recorder is not None, out=self.out,
+                                                  mansion=self.mansion)
+        self.restarting = False
+        if self.hibernator:
+            self.hibernator.touch(self)
+        if self.journal:
+            self.journal.start(self.id, self.player, self.game_state)
+
+    def start(self):
+        self.player.location.enter(self.player, self.game_state)
+        self.out.send(self.prompt())
+
+    def resume(self, key, data):
+        # Takes over a game recovered from the journal, this session's own game is dropped
+        if self.hibernator:
+            self.hibernator.forget(self)
+        self.journal.end(self.id)
+        self.id = key
+        self.player, self.game_state = unpack_session(data, self.out)
+        # A game that had already finished was recorded before the crash
+        self.restarting = self.game_state.end or self.player.steps <= 0
+        if self.hibernator:
+            self.hibernator.touch(self)
+        self.out.send(f"You find your way back to the {self.player.location.get_display_name()}.\n")
+        self.out.send(self.prompt())
+
+    def feed(self, line):
+        if self.hibernator:
+            # Wakes the game if it was put to sleep while the player was away
+            self.hibernator.touch(self)
+        if self.restarting:
+            if line != "yes":
+                self.out.send("Thanks for playing. The circus fades into memory...\n")
+                return False
+            self.reset()
+            self.out.send('---------------------------------------------------------\n')
+            self.start()
+            return True
+
+        handle_command(self.player, self.game_state, line)
+        if self.journal:
+            self.journal.command(self.id, line, self.player, self.game_state)
+        # The turn's text and the next prompt leave in a single write
+        self.out.send(self.prompt())
+        return True
+
+    def prompt(self):
+        game_state = self.game_state
+        if game_state.end or self.player.steps <= 0:
+            text = ""
+            if self.player.steps <= 0 and not game_state.end:
+                text = "\nThe last echo of circus music fades... you collapse as the mansion claims another victim.\n"
+            if not self.restarting:
+                if self.recorder and game_state.log is not None:
+                    self.recorder(record(self.player, self.game_state))
+                if self.outcomes:
+                    self.outcomes.add(self.player, self.game_state)
+            self.restarting = True
+            return text + "\nWould you like to restart the game? (yes/no): "
+        return prompt_text(self.player, game_state)
+
+
+# -----------------------------
+# Server
+# -----------------------------
+class GameServer:
+    def __init__(self, max_sessions=5000, idle_timeout=IDLE_TIMEOUT, record_path=None, metrics_path=None,
+                 mansion=None, hibernator=None, journal_path=None, journal_interval=BATCH_INTERVAL, outcomes_path=None):
+        self.mansion = mansion
+        self.hibernator = hibernator
+        self.journal_path = journal_path
+        self.journal_interval = journal_interval
+        self.journal = None
+        self.live = {}       # session id -> session, for journal checkpoints
+        self.recovered = {}  # session id -> packed game left by the last run, until its player resumes it
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.record_path = record_path
+        self.metrics_path = metrics_path
+        self.outcomes_path = outcomes_path
+        self.outcomes = OutcomeStats() if outcomes_path else None
+        self.sessions = 0
+
+    def save_recording(self, data):
+        # Finished games are appended to a corpus replay.py can check
+        write_corpus(self.record_path, [data], mode="ab")
+
+    def checkpoints(self):
+        for key, session in self.live.items():
+            if session.player is None:
+                yield key, self.hibernator.store.peek(key)
+            else:
+                yield key, pack_session(session.player, session.game_state)
+        yield from self.recovered.items()
+
+    def claim(self, session, line):
+        code = line.split()[-1]
+        try:
+            key = int(code, 16)
+        except ValueError:
+            key = None
+        data = self.recovered.pop(key, None)
+        if data is None:
+            if self.hibernator:
+                # The prompt reads the game, which may have been put to sleep meanwhile
+                self.hibernator.touch(session)
+            session.out.send("No lost game answers to that code.\n")
+            session.out.send(session.prompt())
+            return
+        del self.live[session.id]
+        session.resume(key, data)
+        self.live[key] = session
+
+    def expire(self, key):
+        # Nobody came back for it
+        if self.recovered.pop(key, None) is not None:
+            self.journal.end(key)
+
+    async def handle_client(self, reader, writer):
+        if self.sessions >= self.max_sessions:
+            writer.write(b"The mansion is full. Try again later.\n")
+            await writer.drain()
+            writer.close()
+            return
+
+        self.sessions += 1
+        writer.transport.set_write_buffer_limits(high=WRITE_HIGH_WATER)
+        # Random ids, so a new session never takes over one a previous run left in the journal
+        session = Session(writer, self.save_recording if self.record_path else None, self.mansion,
+                          self.hibernator, secrets.randbits(63), self.journal, self.outcomes)
+        self.live[session.id] = session
+        try:
+            if self.journal:
+                session.out.send(f"If the lights go out, reconnect and type: resume {session.id:x}\n")
+            session.start()
+            await self.send(session, writer)
+            while True:
+                try:
+                    raw = await asyncio.wait_for(reader.readline(), self.idle_timeout)
+                except (asyncio.TimeoutError, asyncio.LimitOverrunError, ValueError):
+                    break
+                if not raw:
+                    break
+
+                line = raw.decode(errors="replace").strip().lower()
+                if self.journal and line.startswith("resume "):
+                    self.claim(session, line)
+                    keep_going = True
+                else:
+                    keep_going = session.feed(line)
+                await self.send(session, writer)
+                if not keep_going:
+                    break
+        except OSError:
+            # The client went away, or the journal couldn't write this turn and it mustn't be shown
+            pass
+        except Exception:
+            # A bug in one game ends that game, not every other one on this server
+            traceback.print_exc()
+            writer.write(CRASHED)
+        finally:
+            self.sessions -= 1
+            self.live.pop(session.id, None)
+            if self.hibernator:
+                self.hibernator.forget(session)
+            if self.journal:
+                self.journal.end(session.id)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def send(self, session, writer):
+        if self.journal:
+            # Nothing the player sees may get ahead of the journal
+            await self.journal.sync()
+        session.out.flush()
+        # Back off until this client has read what we've already sent
+        await writer.drain()
+
+    def open_journal(self):
+        self.recovered, diverged = recover(self.journal_path)
+        if diverged:
+            print(f"{len(diverged)} recovered games didn't replay to their journaled state", file=sys.stderr)
+        self.journal = Journal(self.journal_path, self.checkpoints, self.journal_interval)
+        # Start the new run from checkpoints rather than replaying the old log next time
+        self.journal.compact()
+        loop = asyncio.get_running_loop()
+        for key in self.recovered:
+            loop.call_later(self.idle_timeout, self.expire, key)
+
+    async def export(self, interval):
+        while True:
+            await asyncio.sleep(interval)
+            self.write_exports()
+
+    def write_exports(self):
+        if self.metrics_path:
+            metrics.REGISTRY.write(self.metrics_path)
+        if self.outcomes_path:
+            self.outcomes.write(self.outcomes_path)
+
+    async def serve(self, host, port, metrics_interval=METRICS_INTERVAL, reuse_port=False):
+        if self.journal_path:
+            self.open_journal()
+        if self.mansion is None:
+            # Built before the first player connects, so no one's help stalls everyone else's turn
+            solver.standard_table()
+        server = await asyncio.start_server(self.handle_client, host, port, limit=MAX_LINE, backlog=BACKLOG,
+                                            reuse_port=reuse_port or None)
+        exporter = None
+        if self.metrics_path:
+            metrics.enable()
+        if self.metrics_path or self.outcomes_path:
+            exporter = asyncio.create_task(self.export(metrics_interval))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if exporter:
+                exporter.cancel()
+                self.write_exports()
+            if self.journal:
+                # Games still connected are left unended, so their players can resume them next run
+                self.journal.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host the mansion for many players over TCP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--max-sessions", type=int, default=5000)
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT)
+    parser.add_argument("--record", metavar="CORPUS", help="append every finished game to this replay corpus")
+    parser.add_argument("--metrics", metavar="FILE", help="write Prometheus text-format metrics to this file")
+    parser.add_argument("--metrics-interval", type=float, default=METRICS_INTERVAL,
+                        help="seconds between writes of the metrics and outcomes files")
+    parser.add_argument("--outcomes", metavar="FILE", help="keep win/loss sketches of finished games, dumped here")
+    parser.add_argument("--mansion", metavar="FILE", help="serve this mansion data file instead of the default")
+    parser.add_argument("--hibernate", metavar="DB", help="put idle games to sleep in this sqlite file")
+    parser.add_argument("--max-awake", type=int, default=10000, help="games kept in memory when hibernating")
+    parser.add_argument("--max-awake-mb", type=float, help="memory cap for awake games, overrides --max-awake")
+    parser.add_argument("--journal", metavar="FILE", help="log every turn here so games survive a restart")
+    parser.add_argument("--journal-interval", type=float, default=BATCH_INTERVAL,
+                        help="seconds each journal batch collects turns before one fsync")
+    args = parser.parse_args()
+
+    if args.mansion and (args.record or args.hibernate or args.journal):
+        parser.error("recording, hibernation and journaling are only supported for the default mansion")
+    hibernator = None
+    if args.hibernate:
+        max_awake = int(args.max_awake_mb * 2 ** 20 // SESSION_BYTES) if args.max_awake_mb else args.max_awake
+        hibernator = Hibernator(SessionStore(args.hibernate), max(1, max_awake))
+    mansion = None
+    if args.mansion:
+        mansion = load_mansion(args.mansion)
+        check_mansion(mansion)
+    server = GameServer(args.max_sessions, args.idle_timeout, args.record, args.metrics, mansion, hibernator,
+                        args.journal, args.journal_interval, args.outcomes)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.metrics_interval))
+    except KeyboardInterrupt:
+        pass
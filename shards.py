@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import contextlib
+import multiprocessing
+import os
+import socket
+import sys
+from multiprocessing.connection import wait
+
+from main import check_mansion
+from mansion import load_mansion
+from server import IDLE_TIMEOUT, GameServer
+
+
+# -----------------------------
+# Worker
+# -----------------------------
+async def serve_until_orphaned(server, host, port, parent):
+    # The supervisor holds the other end of this pipe, it reads as closed once the supervisor
+    # is gone however it went, and a worker must not keep the port on its own
+    task = asyncio.create_task(server.serve(host, port, reuse_port=True))
+    asyncio.get_running_loop().add_reader(parent.fileno(), task.cancel)
+    with contextlib.suppress(asyncio.CancelledError):
+        await task
+
+
+def work(parent, host, port, max_sessions, idle_timeout, mansion_path=None):
+    # A whole server of its own. Every worker listens on the same port and the kernel hands
+    # each new connection to one of them, so a player's reads, turns and writes all stay here
+    mansion = None
+    if mansion_path:
+        mansion = load_mansion(mansion_path)
+        check_mansion(mansion)
+    server = GameServer(max_sessions, idle_timeout, mansion=mansion)
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(serve_until_orphaned(server, host, port, parent))
+
+
+# -----------------------------
+# Supervisor
+# -----------------------------
+class ShardedServer:
+    # Starts the workers and waits on them, it never touches a client connection itself
+    def __init__(self, workers=None, max_sessions=5000, idle_timeout=IDLE_TIMEOUT, mansion_path=None):
+        self.workers = workers or os.cpu_count() or 1
+        # The cap is split evenly, each worker only knows its own sessions
+        self.max_sessions = -(-max_sessions // self.workers)
+        self.idle_timeout = idle_timeout
+        self.mansion_path = mansion_path
+        self.processes = []
+        self.lifelines = []  # write ends of the pipes the workers watch, never written
+
+    def start_workers(self, host, port):
+        # Spawned rather than forked so no worker inherits another's state. They all map the same
+        # compiled mansion file, so the room data is one read-only copy in the page cache
+        context = multiprocessing.get_context("spawn")
+        for _ in range(self.workers):
+            theirs, ours = context.Pipe(duplex=False)
+            process = context.Process(target=work, daemon=True,
+                                      args=(theirs, host, port, self.max_sessions, self.idle_timeout, self.mansion_path))
+            process.start()
+            theirs.close()
+            self.processes.append(process)
+            self.lifelines.append(ours)
+
+    def serve(self, host, port):
+        self.start_workers(host, port)
+        try:
+            running = list(self.processes)
+            while running:
+                for sentinel in wait([process.sentinel for process in running]):
+                    process = next(process for process in running if process.sentinel == sentinel)
+                    # Its players are disconnected, new ones go to the workers still listening
+                    print(f"worker {process.pid} exited with code {process.exitcode}", file=sys.stderr)
+                    running.remove(process)
+        finally:
+            for lifeline in self.lifelines:
+                lifeline.close()
+            for process in self.processes:
+                process.join(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Host the mansion across a pool of worker processes.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7777)
+    parser.add_argument("--workers", type=int, help="worker processes, defaults to one per core")
+    parser.add_argument("--max-sessions", type=int, default=5000)
+    parser.add_argument("--idle-timeout", type=float, default=IDLE_TIMEOUT)
+    parser.add_argument("--mansion", metavar="FILE", help="serve this mansion data file instead of the default")
+    args = parser.parse_args()
+
+    if not hasattr(socket, "SO_REUSEPORT"):
+        parser.error("sharding needs SO_REUSEPORT, run server.py on this platform")
+    if args.mansion:
+        check_mansion(load_mansion(args.mansion))
+    server = ShardedServer(args.workers, args.max_sessions, args.idle_timeout, args.mansion)
+    try:
+        server.serve(args.host, args.port)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,229 @@
+import argparse
+import os
+import random
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from main import NULL_SINK, setup_game, handle_command
+from outcomes import OutcomeStats
+
+
+Outcome = namedtuple("Outcome", "seed won steps turns scares")
+
+
+# -----------------------------
+# Agent Policies
+# -----------------------------
+class Policy:
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self.answers = []
+
+    def choose(self, player, game_state):
+        raise NotImplementedError
+
+    def answer(self, player, game_state):
+        # Puzzle prompts are answered from the queue filled when the policy chose "solve"
+        return self.answers.pop(0) if self.answers else "back"
+
+    def queue_answers(self, player, game_state, know_code):
+        name = player.location.actual_name
+        if name == "Color Puzzle Room":
+            code = game_state.color_code if know_code else self.rng.sample(game_state.color_code, 4)
+            self.answers = [" ".join(code)]
+        elif name == "Graveyard":
+            order = game_state.grave_order if know_code else self.rng.sample(game_state.grave_order, 3)
+            self.answers = list(order)
+
+
+class RandomPolicy(Policy):
+    def choose(self, player, game_state):
+        room = player.location
+        options = [f"go {direction}" for direction in room.exits]
+        options += [f"take {item}" for item in room.items]
+        options += [f"use {item}" for item in player.inventory]
+        options += ["look", "lift", "solve"]
+        command = self.rng.choice(options)
+        if command == "solve":
+            self.queue_answers(player, game_state, know_code=False)
+        return command
+
+
+class ScriptedPolicy(Policy):
+    # The intended walkthrough, puzzle answers are filled in from the secret codes
+    SCRIPT = (
+        ["go forward", "go left", "take crowbar", "go back", "go right", "use crowbar",
+         "go forward", "take lever", "go forward", "lift", "go right", "go forward",
+         "use lever", "take dagger", "go right", "go left", "take color note",
+         "take clown nose", "go back", "go back", "go back", "go left", "go right"]
+        + ["use dagger"] * 10
+        + ["take blue button", "go left", "take graveyard note", "go back", "go back",
+           "go back", "go forward", "use blue button", "solve", "go forward",
+           "go forward", "solve", "take wheel handle", "go right", "use wheel handle",
+           "go left", "go forward"]
+    )
+
+    def __init__(self, seed=None):
+        super().__init__(seed)
+        self.position = 0
+
+    def choose(self, player, game_state):
+        if self.position >= len(self.SCRIPT):
+            return "look"
+        command = self.SCRIPT[self.position]
+        self.position += 1
+        if command == "solve":
+            self.queue_answers(player, game_state, know_code=True)
+        return command
+
+
+class GreedyPolicy(Policy):
+    def __init__(self, seed=None):
+        super().__init__(seed)
+        self.tried = set()
+
+    def choose(self, player, game_state):
+        room = player.location
+        name = room.actual_name
+
+        if room.items:
+            return f"take {next(iter(room.items))}"
+
+        if name == "Balloon Room" and "dagger" in player.inventory and not game_state.secret_room_opened:
+            return "use dagger"
+
+        for item in player.inventory:
+            if "note" in item:
+                continue
+            if (name, item) not in self.tried:
+                self.tried.add((name, item))
+                return f"use {item}"
+
+        if name == "Dining Hall" and not game_state.lifted:
+            return "lift"
+
+        solvable = (name == "Graveyard" and not game_state.grave_solved) or \
+                   (name == "Color Puzzle Room" and game_state.color_puzzle_unlocked and not game_state.color_solved)
+        if solvable and (name, "solve", player.steps) not in self.tried:
+            self.tried.add((name, "solve", player.steps))
+            note = "graveyard note" if name == "Graveyard" else "color note"
+            self.queue_answers(player, game_state, know_code=note in player.inventory)
+            return "solve"
+
+        unvisited = [direction for direction, name in room.exits.items() if not room.world.has_visited(name)]
+        if unvisited:
+            return f"go {self.rng.choice(unvisited)}"
+        return f"go {self.rng.choice(list(room.exits))}"
+
+
+POLICIES = {
+    "random": RandomPolicy,
+    "scripted": ScriptedPolicy,
+    "greedy": GreedyPolicy,
+}
+
+
+# -----------------------------
+# Headless Playthrough
+# -----------------------------
+def run_game(seed, policy_name="greedy", max_turns=500, record=False):
+    player, game_state = setup_game(seed, record, NULL_SINK)
+    policy = POLICIES[policy_name](seed)
+
+    player.location.enter(player, game_state)
+    turns = 0
+    while player.steps > 0 and not game_state.end and turns < max_turns:
+        if game_state.puzzle:
+            command = policy.answer(player, game_state)
+        else:
+            command = policy.choose(player, game_state)
+            turns += 1
+        handle_command(player, game_state, command)
+    return player, game_state, turns
+
+
+def play(seed, policy_name="greedy", max_turns=500):
+    player, game_state, turns = run_game(seed, policy_name, max_turns)
+    return Outcome(seed, game_state.won, player.steps, turns, game_state.scares)
+
+
+def play_chunk(seeds, policy_name, max_turns):
+    return [play(seed, policy_name, max_turns) for seed in seeds]
+
+
+def stats_chunk(seeds, policy_name, max_turns):
+    stats = OutcomeStats()
+    for seed in seeds:
+        player, game_state, turns = run_game(seed, policy_name, max_turns)
+        stats.add(player, game_state)
+    return stats
+
+
+def run_stats(games, policy_name="greedy", seed=0, workers=None, chunk_size=2000, max_turns=500):
+    # Like run_batch, but each worker only hands back its merged sketches instead of every outcome
+    workers = workers or os.cpu_count() or 1
+    seeds = range(seed, seed + games)
+    chunks = [seeds[i:i + chunk_size] for i in range(0, games, chunk_size)]
+
+    stats = OutcomeStats()
+    if workers == 1:
+        for chunk in chunks:
+            stats.merge(stats_chunk(chunk, policy_name, max_turns))
+        return stats
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(stats_chunk, chunk, policy_name, max_turns) for chunk in chunks]
+        for future in futures:
+            stats.merge(future.result())
+    return stats
+
+
+def run_batch(games, policy_name="greedy", seed=0, workers=None, chunk_size=2000, max_turns=500):
+    workers = workers or os.cpu_count() or 1
+    seeds = range(seed, seed + games)
+    chunks = [seeds[i:i + chunk_size] for i in range(0, games, chunk_size)]
+
+    if workers == 1:
+        return [outcome for chunk in chunks for outcome in play_chunk(chunk, policy_name, max_turns)]
+
+    outcomes = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(play_chunk, chunk, policy_name, max_turns) for chunk in chunks]
+        for future in futures:
+            outcomes.extend(future.result())
+    return outcomes
+
+
+def summarize(outcomes, elapsed):
+    games = len(outcomes)
+    wins = sum(outcome.won for outcome in outcomes)
+    print(f"Games played:      {games}")
+    print(f"Win rate:          {wins / games:.2%}")
+    print(f"Avg steps left:    {sum(o.steps for o in outcomes) / games:.2f}")
+    print(f"Avg turns:         {sum(o.turns for o in outcomes) / games:.2f}")
+    print(f"Avg scares hit:    {sum(o.scares for o in outcomes) / games:.3f}")
+    print(f"Throughput:        {games / elapsed:,.0f} games/sec")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run headless playthroughs of the mansion.")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--policy", choices=sorted(POLICIES), default="greedy")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--max-turns", type=int, default=500)
+    parser.add_argument("--outcomes", metavar="FILE", help="stream results into sketches and dump them here")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.outcomes:
+        stats = run_stats(args.games, args.policy, args.seed, args.workers, max_turns=args.max_turns)
+        stats.write(args.outcomes)
+        print(f"Games played:      {stats.games}")
+        print(f"Win rate:          {stats.results['won'] / stats.games:.2%}")
+        print(f"Costliest:         {stats.costliest()}")
+        print(f"Throughput:        {stats.games / (time.perf_counter() - start):,.0f} games/sec")
+        raise SystemExit
+    results = run_batch(args.games, args.policy, args.seed, args.workers, max_turns=args.max_turns)
+    summarize(results, time.perf_counter() - start)
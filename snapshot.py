@@ -0,0 +1,197 @@
+import struct
+from itertools import permutations
+
+from main import (MANSION, ITEMS, DIRECTIONS, AMBIENT_EVENTS, MAJOR_SCARES,
+                  GameState, ItemSet, Player, World)
+
+
+# -----------------------------
+# Lookup Tables
+# -----------------------------
+VERSION = 3
+
+ROOM_NAMES = tuple(MANSION)
+ROOM_INDEX = {name: index for index, name in enumerate(ROOM_NAMES)}
+ITEM_INDEX = {item: index for index, item in enumerate(ITEMS)}
+
+COLOR_CODES = list(permutations(["red", "green", "blue", "yellow"]))
+GRAVE_ORDERS = list(permutations(["oldest", "middle", "youngest"]))
+COLOR_INDEX = {code: index for index, code in enumerate(COLOR_CODES)}
+GRAVE_INDEX = {order: index for index, order in enumerate(GRAVE_ORDERS)}
+
+FLAGS = ("blue_button_found", "color_puzzle_unlocked", "secret_room_opened", "dagger_unlocked",
+         "lifted", "color_solved", "grave_solved", "end", "won")
+PUZZLES = (None, "color", "graveyard")
+GRAVES = ("oldest", "middle", "youngest")
+
+# Per room: which of the four directions are open, and which description variant is showing
+EXIT_MASKS = [sum(1 << bit for bit, d in enumerate(DIRECTIONS) if d in MANSION[name].exits) for name in ROOM_NAMES]
+VARIANT_KEYS = {name: (None,) + tuple(MANSION[name].variants) for name in ROOM_NAMES}
+NIBBLE_BYTES = (len(ROOM_NAMES) + 1) // 2
+
+# version, room, steps, inventory, item rooms, flags, pops, scares, turns, puzzle misses, codes,
+# ambient pool, scare pool, puzzle, visited, exits, descriptions, rng state
+RECORD = struct.Struct(f"<BBbH{len(ITEMS)}sHBBHBBIHBI{NIBBLE_BYTES}s{NIBBLE_BYTES}sQ")
+SIZE = RECORD.size
+
+
+# -----------------------------
+# Packing Helpers
+# -----------------------------
+def pack_nibbles(values):
+    values = list(values) + [0] * (len(values) % 2)
+    return bytes(values[i] | values[i + 1] << 4 for i in range(0, len(values), 2))
+
+
+def set_nibble(buffer, index, value):
+    shift = (index & 1) * 4
+    buffer[index >> 1] = buffer[index >> 1] & ~(0xF << shift) | value << shift
+
+
+def changed_nibbles(data, base):
+    # (index, value) for every nibble that differs from the template
+    for position, (byte, base_byte) in enumerate(zip(data, base)):
+        if byte != base_byte:
+            for index in (position * 2, position * 2 + 1):
+                value = byte >> (index & 1) * 4 & 0xF
+                if value != base_byte >> (index & 1) * 4 & 0xF:
+                    yield index, value
+
+
+def pack_pool(pool, events, bits):
+    # Length in the low 3 bits, then each remaining event index in order
+    value = len(pool)
+    for position, event in enumerate(pool):
+        value |= events.index(event) << (3 + position * bits)
+    return value
+
+
+def unpack_pool(value, events, bits):
+    mask = (1 << bits) - 1
+    return [events[value >> (3 + position * bits) & mask] for position in range(value & 0b111)]
+
+
+# What a game that hasn't changed anything looks like
+TEMPLATE_ITEM_ROOMS = bytearray(len(ITEMS))
+for _index, _name in enumerate(ROOM_NAMES):
+    for _item in MANSION[_name].items:
+        TEMPLATE_ITEM_ROOMS[ITEM_INDEX[_item]] = _index + 1
+TEMPLATE_ITEM_ROOMS = bytes(TEMPLATE_ITEM_ROOMS)
+TEMPLATE_EXITS = pack_nibbles(EXIT_MASKS)
+TEMPLATE_DESCRIPTIONS = bytes(NIBBLE_BYTES)
+
+
+# -----------------------------
+# Save / Restore
+# -----------------------------
+def save(player, game_state):
+    world = game_state.world
+
+    # The registry numbers this mansion's items first, so the inventory's bits are already ours
+    inventory = player.inventory.bits
+
+    # 0 means the item isn't lying in any room
+    item_rooms = TEMPLATE_ITEM_ROOMS
+    if world.items:
+        item_rooms = bytearray(item_rooms)
+        for name in world.items:
+            for item in MANSION[name].items:
+                item_rooms[ITEM_INDEX[item]] = 0
+        for name, bits in world.items.items():
+            for item in ItemSet(bits):
+                item_rooms[ITEM_INDEX[item]] = ROOM_INDEX[name] + 1
+
+    flags = 0
+    for bit, flag in enumerate(FLAGS):
+        if getattr(game_state, flag):
+            flags |= 1 << bit
+
+    codes = COLOR_INDEX[tuple(game_state.color_code)] * len(GRAVE_ORDERS) + GRAVE_INDEX[tuple(game_state.grave_order)]
+
+    puzzle = PUZZLES.index(game_state.puzzle)
+    if game_state.puzzle == "graveyard":
+        puzzle |= len(game_state.grave_choices) << 2
+        for position, choice in enumerate(game_state.grave_choices):
+            puzzle |= GRAVES.index(choice) << (4 + position * 2)
+
+    # Room ids are the mansion's own order, the same one ROOM_INDEX uses
+    visited = world.visited
+
+    exits = TEMPLATE_EXITS
+    if world.exits:
+        exits = bytearray(exits)
+        for name, overlay in world.exits.items():
+            template = MANSION[name]
+            mask = 0
+            for direction, target in overlay.items():
+                if target != template.exits.get(direction, template.hidden.get(direction)):
+                    raise ValueError(f"Can't snapshot exit {direction} of {name} to {target}")
+                mask |= 1 << DIRECTIONS.index(direction)
+            set_nibble(exits, ROOM_INDEX[name], mask)
+
+    descriptions = TEMPLATE_DESCRIPTIONS
+    if world.descriptions:
+        descriptions = bytearray(descriptions)
+        for name, key in world.descriptions.items():
+            set_nibble(descriptions, ROOM_INDEX[name], VARIANT_KEYS[name].index(key))
+
+    return RECORD.pack(
+        VERSION, ROOM_INDEX[player.location.actual_name], player.steps, inventory, bytes(item_rooms),
+        flags, game_state.balloon_pop_count, game_state.scares, min(game_state.turns, 0xFFFF),
+        min(game_state.color_misses, 15) | min(game_state.grave_misses, 15) << 4, codes,
+        pack_pool(game_state.ambient_pool, AMBIENT_EVENTS, 3), pack_pool(game_state.major_scare_pool, MAJOR_SCARES, 2),
+        puzzle, visited, bytes(exits), bytes(descriptions), game_state.rng.state)
+
+
+def restore(data, out=None):
+    (version, room, steps, inventory, item_rooms, flags, pops, scares, turns, misses, codes, ambient, major,
+     puzzle, visited, exits, descriptions, rng_state) = RECORD.unpack(data)
+    if version != VERSION:
+        raise ValueError(f"Unsupported snapshot version {version}")
+
+    game_state = GameState(list(COLOR_CODES[codes // len(GRAVE_ORDERS)]), list(GRAVE_ORDERS[codes % len(GRAVE_ORDERS)]),
+                           seed=rng_state, out=out)
+    world = game_state.world = World(MANSION)
+
+    for bit, flag in enumerate(FLAGS):
+        setattr(game_state, flag, bool(flags >> bit & 1))
+    game_state.balloon_pop_count = pops
+    game_state.balloon_count -= pops
+    game_state.scares = scares
+    game_state.turns = turns
+    game_state.color_misses = misses & 0xF
+    game_state.grave_misses = misses >> 4
+    game_state.ambient_pool = unpack_pool(ambient, AMBIENT_EVENTS, 3)
+    game_state.major_scare_pool = unpack_pool(major, MAJOR_SCARES, 2)
+    game_state.puzzle = PUZZLES[puzzle & 0b11]
+    game_state.grave_choices = [GRAVES[puzzle >> (4 + position * 2) & 0b11] for position in range(puzzle >> 2 & 0b11)]
+    world.visited = visited
+
+    # Only rooms that differ from the template go back into the overlay
+    if item_rooms != TEMPLATE_ITEM_ROOMS:
+        for index, (now, before) in enumerate(zip(item_rooms, TEMPLATE_ITEM_ROOMS)):
+            if now != before:
+                for changed in (now, before):
+                    if changed:
+                        name = ROOM_NAMES[changed - 1]
+                        world.items[name] = sum(1 << position for position, place in enumerate(item_rooms)
+                                                if place == changed)
+
+    if exits != TEMPLATE_EXITS:
+        for index, mask in changed_nibbles(exits, TEMPLATE_EXITS):
+            template = MANSION[ROOM_NAMES[index]]
+            overlay = {}
+            for direction, target in list(template.exits.items()) + list(template.hidden.items()):
+                if mask >> DIRECTIONS.index(direction) & 1:
+                    overlay.setdefault(direction, target)
+            world.room(template.actual_name).set_exits(overlay)
+
+    if descriptions != TEMPLATE_DESCRIPTIONS:
+        for index, variant in changed_nibbles(descriptions, TEMPLATE_DESCRIPTIONS):
+            name = ROOM_NAMES[index]
+            world.room(name).set_description(VARIANT_KEYS[name][variant])
+
+    player = Player(world.room(ROOM_NAMES[room]))
+    player.steps = steps
+    player.inventory = ItemSet(inventory)
+    return player, game_state
@@ -0,0 +1,199 @@
+from collections import deque
+from functools import lru_cache
+
+import snapshot
+from explore import ForcedRolls
+from main import BALLOON_COUNT, NULL_SINK, USE_RULES, handle_command, setup_game
+
+
+# Plenty of steps so exploring never ends a game early, the step budget is checked afterwards
+EXPLORE_STEPS = 100
+
+# Flags that change what the player can do next, "lifted" only changes a description
+FLAG_MASK = sum(1 << bit for bit, flag in enumerate(snapshot.FLAGS) if flag != "lifted")
+
+
+# -----------------------------
+# State Keys
+# -----------------------------
+def state_key(data):
+    # Everything that decides future moves, leaving out steps, cosmetics, the secret codes and the rng.
+    # How many balloons are popped doesn't either: popping is free and the last pop always opens the
+    # secret room, which is a flag of its own
+    (version, room, steps, inventory, item_rooms, flags, pops, scares, turns, misses, codes, ambient, major,
+     puzzle, visited, exits, descriptions, rng_state) = snapshot.RECORD.unpack(data)
+    return room, inventory, item_rooms, flags & FLAG_MASK, puzzle, exits
+
+
+def flag(key, name):
+    return bool(key[3] >> snapshot.FLAGS.index(name) & 1)
+
+
+# -----------------------------
+# Moves
+# -----------------------------
+def candidate_actions(player, game_state):
+    room = player.location
+    actions = [f"go {direction}" for direction in room.exits]
+    actions += [f"take {item}" for item in room.items]
+    actions += [f"use {item}" for item in player.inventory if (item, room.actual_name) in USE_RULES]
+    if room.actual_name in ("Graveyard", "Color Puzzle Room"):
+        actions.append("solve")
+    return actions
+
+
+def apply_action(player, game_state, action):
+    handle_command(player, game_state, action)
+    if action == "use dagger":
+        # Popping costs no steps and always ends with the button dropped and the secret room open,
+        # so the random drop can be skipped by popping every balloon in one move
+        while not game_state.secret_room_opened:
+            handle_command(player, game_state, action)
+    elif game_state.puzzle == "color":
+        handle_command(player, game_state, " ".join(game_state.color_code))
+    elif game_state.puzzle == "graveyard":
+        for grave in game_state.grave_order:
+            handle_command(player, game_state, grave)
+
+
+def expand(data):
+    edges = []
+    player, game_state = snapshot.restore(data, NULL_SINK)
+    for position, action in enumerate(candidate_actions(player, game_state)):
+        if position:
+            player, game_state = snapshot.restore(data, NULL_SINK)
+        player.steps = EXPLORE_STEPS
+        apply_action(player, game_state, action)
+        delta = player.steps - EXPLORE_STEPS
+        after = snapshot.save(player, game_state)
+        edges.append((action, after, delta))
+    return edges
+
+
+def early_drop(data):
+    # The moves above pop every balloon at once, but a player can stop after any pop once the
+    # button has dropped. That state is searched too, so no hint has to search on demand
+    player, game_state = snapshot.restore(data, NULL_SINK)
+    if ("dagger", player.location.actual_name) not in USE_RULES or "dagger" not in player.inventory:
+        return None
+    if game_state.blue_button_found or game_state.balloon_pop_count + 1 >= BALLOON_COUNT:
+        return None
+    rng = game_state.rng
+    game_state.rng = ForcedRolls(rng, (True,))
+    handle_command(player, game_state, "use dagger")
+    game_state.rng = rng
+    return snapshot.save(player, game_state)
+
+
+# -----------------------------
+# Search
+# -----------------------------
+def explore(data):
+    # Breadth-first over abstract states, the transposition table keeps one expansion per key
+    start = state_key(data)
+    graph = {}
+    queue = deque([data])
+    seen = {start}
+    while queue:
+        current = queue.popleft()
+        key = state_key(current)
+        graph[key] = []
+        if flag(key, "end"):
+            continue
+        for action, after, delta in expand(current):
+            next_key = state_key(after)
+            if next_key == key and delta == 0:
+                continue
+            graph[key].append((action, next_key, delta))
+            if next_key not in seen:
+                seen.add(next_key)
+                queue.append(after)
+        # Reachable by a lucky pop, but never an edge, a hint doesn't gamble on the drop
+        after = early_drop(current)
+        if after is not None and state_key(after) not in seen:
+            seen.add(state_key(after))
+            queue.append(after)
+    return start, graph
+
+
+def solve_values(graph):
+    # Best achievable change in steps from each state to a win, worked backwards from the wins.
+    # No cycle gains steps overall, so a state only re-enters the queue when it really improves
+    predecessors = {key: [] for key in graph}
+    for key, edges in graph.items():
+        for action, next_key, delta in edges:
+            predecessors[next_key].append((key, action, delta))
+
+    values = {}
+    best = {}
+    queue = deque(key for key in graph if flag(key, "won"))
+    for key in queue:
+        values[key] = 0
+    while queue:
+        key = queue.popleft()
+        for previous, action, delta in predecessors[key]:
+            value = values[key] + delta
+            if value > values.get(previous, value - 1):
+                values[previous] = value
+                best[previous] = action
+                queue.append(previous)
+    return values, best
+
+
+class HintTable:
+    def __init__(self, data):
+        self.start, self.graph = explore(data)
+        self.values, self.best = solve_values(self.graph)
+
+    def lookup(self, key):
+        return self.values.get(key), self.best.get(key)
+
+    def route(self):
+        actions = []
+        key = self.start
+        while key in self.best:
+            action = self.best[key]
+            actions.append(action)
+            key = next(next_key for name, next_key, delta in self.graph[key] if name == action)
+        return actions
+
+
+@lru_cache(maxsize=1)
+def standard_table():
+    # The graph doesn't depend on the secret codes, so one table serves every game. Servers
+    # build it at startup, it's the only search a hint ever needs
+    player, game_state = setup_game(out=NULL_SINK)
+    return HintTable(snapshot.save(player, game_state))
+
+
+# -----------------------------
+# Public Helpers
+# -----------------------------
+def minimum_steps():
+    table = standard_table()
+    return -table.values[table.start]
+
+
+def best_action(player, game_state):
+    if game_state.puzzle or game_state.end:
+        return None
+    data = snapshot.save(player, game_state)
+    key = state_key(data)
+    value, action = standard_table().lookup(key)
+    if value is None or player.steps + value < 1:
+        return None
+    return action
+
+
+if __name__ == "__main__":
+    import time
+
+    start = time.perf_counter()
+    table = standard_table()
+    elapsed = time.perf_counter() - start
+    print(f"States explored:   {len(table.graph)}")
+    print(f"Solve time:        {elapsed * 1000:.1f} ms")
+    print(f"Minimum steps:     {minimum_steps()}")
+    print("Route:")
+    for action in table.route():
+        print(f"  {action}")
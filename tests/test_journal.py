@@ -0,0 +1,129 @@
+import asyncio
+import os
+import random
+
+from journal import COMMAND, EFFECTS, START, SEED, Journal, pack_record, read_records, recover
+from main import NULL_SINK, handle_command, setup_game
+from replay import encode_commands, pack_session
+from transcripts import VOCABULARY
+
+
+def play_journaled(journal, games=20, turns=40):
+    # Live games, each journaled the way the server does it. Returns {session id: (player, game_state)}
+    rng = random.Random(7)
+    live = {}
+    for key in range(1, games + 1):
+        player, game_state = setup_game(key, record=key % 2 == 0, out=NULL_SINK)
+        player.location.enter(player, game_state)
+        journal.start(key, player, game_state)
+        live[key] = (player, game_state)
+    for _ in range(turns):
+        for key, (player, game_state) in list(live.items()):
+            if game_state.end or player.steps <= 0:
+                journal.end(key)
+                del live[key]
+                continue
+            line = rng.choice([line for line in VOCABULARY if line != "quit"])
+            handle_command(player, game_state, line)
+            journal.command(key, line, player, game_state)
+    return live
+
+
+def test_recovers_every_live_game(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = Journal(path)
+    live = play_journaled(journal)
+    journal.close()
+
+    games, diverged = recover(path)
+    assert diverged == []
+    assert games == {key: pack_session(*game) for key, game in live.items()}
+
+
+def test_torn_tail_is_dropped(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = Journal(path)
+    live = play_journaled(journal)
+    journal.close()
+    good = os.path.getsize(path)
+
+    # A crash halfway through writing the next record
+    key = next(iter(live))
+    with open(path, "ab") as f:
+        f.write(pack_record(COMMAND, key, bytes(EFFECTS.size) + encode_commands(["look"]))[:-3])
+
+    games, diverged = recover(path)
+    assert os.path.getsize(path) == good
+    assert games == {key: pack_session(*game) for key, game in live.items()}
+    with open(path, "rb") as f:
+        assert read_records(f.read())[1] == good
+
+
+def test_bad_record_costs_only_its_game(tmp_path):
+    # A command cut inside a UTF-8 character, as older versions could write
+    path = str(tmp_path / "journal")
+    with open(path, "wb") as f:
+        f.write(pack_record(START, 1, SEED.pack(0, 5)))
+        f.write(pack_record(COMMAND, 1, bytes(EFFECTS.size) + bytes((255, 2)) + "é".encode()[:1] + b"x"))
+        f.write(pack_record(START, 2, SEED.pack(0, 6)))
+    games, diverged = recover(path)
+    assert sorted(games) == [1, 2]
+    assert diverged == [1]
+
+
+def test_long_lines_are_cut_on_a_character(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = Journal(path)
+    player, game_state = setup_game(3, out=NULL_SINK)
+    player.location.enter(player, game_state)
+    journal.start(1, player, game_state)
+    line = "a" + "�" * 200
+    handle_command(player, game_state, line)
+    journal.command(1, line, player, game_state)
+    journal.close()
+    games, diverged = recover(path)
+    assert list(games) == [1] and diverged == []
+
+
+def test_group_commit(tmp_path):
+    # Every session waiting on the same batch is released by one write
+    path = str(tmp_path / "journal")
+    journal = Journal(path, interval=0.01)
+    writes = []
+    write = journal.write
+    journal.write = lambda data: (writes.append(len(data)), write(data))
+
+    async def main():
+        player, game_state = setup_game(1, out=NULL_SINK)
+        for key in range(10):
+            journal.start(key, player, game_state)
+        await asyncio.gather(*(journal.sync() for _ in range(10)))
+
+    asyncio.run(main())
+    journal.close()
+    assert len(writes) == 1
+    assert len(recover(path)[0]) == 10
+
+
+def test_failed_write_fails_its_waiters(tmp_path):
+    path = str(tmp_path / "journal")
+    journal = Journal(path, interval=0.001)
+    write = journal.write
+
+    def broken(data):
+        raise OSError("disk full")
+
+    async def main():
+        player, game_state = setup_game(1, out=NULL_SINK)
+        journal.write = broken
+        journal.start(1, player, game_state)
+        results = await asyncio.gather(journal.sync(), journal.sync(), return_exceptions=True)
+        assert all(isinstance(result, OSError) for result in results)
+        # The next batch goes through once the disk is back
+        journal.write = write
+        journal.start(2, player, game_state)
+        await asyncio.wait_for(journal.sync(), 1)
+
+    asyncio.run(main())
+    journal.close()
+    assert list(recover(path)[0]) == [2]
@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+import snapshot
+from main import BufferSink, handle_command, setup_game
+from transcripts import VOCABULARY
+
+
+def random_lines(rng, count):
+    return [line for line in (rng.choice(VOCABULARY) for _ in range(count)) if line != "quit"]
+
+
+def play(player, game_state, lines):
+    for line in lines:
+        if game_state.end or player.steps <= 0:
+            break
+        handle_command(player, game_state, line)
+
+
+@pytest.mark.parametrize("seed", range(40))
+def test_restored_game_plays_on_the_same(seed):
+    # Save partway, restore, then both copies must print and end up exactly alike
+    rng = random.Random(seed)
+    player, game_state = setup_game(seed, out=BufferSink())
+    player.location.enter(player, game_state)
+    play(player, game_state, random_lines(rng, rng.randrange(60)))
+    game_state.out.take()
+
+    data = snapshot.save(player, game_state)
+    assert len(data) == snapshot.SIZE
+    copy, copy_state = snapshot.restore(data, BufferSink())
+    assert snapshot.save(copy, copy_state) == data
+
+    rest = random_lines(rng, 120)
+    play(player, game_state, rest)
+    play(copy, copy_state, rest)
+    assert copy_state.out.take() == game_state.out.take()
+    assert snapshot.save(copy, copy_state) == snapshot.save(player, game_state)
+
+
+def test_rejects_other_versions():
+    player, game_state = setup_game(1, out=BufferSink())
+    data = bytearray(snapshot.save(player, game_state))
+    data[0] = snapshot.VERSION + 1
+    with pytest.raises(ValueError):
+        snapshot.restore(bytes(data))
@@ -0,0 +1,5 @@
+from transcripts import EXPECTED, transcript_hash
+
+
+def test_transcripts_unchanged():
+    assert transcript_hash() == EXPECTED
@@ -0,0 +1,55 @@
+import hashlib
+import random
+
+import main
+from main import BufferSink, handle_command, setup_game
+
+
+# Everything a player might type, including lines that should just be refused
+VOCABULARY = (
+    ["go forward", "go back", "go left", "go right", "go up", "go", "go ", "look", "look ", "lift", "help",
+     "inventory", "solve", "quit", "xyzzy", "red green blue yellow", "back", "oldest", "middle", "youngest"]
+    + [f"{verb} {item}" for verb in ("take", "use") for item in main.ITEMS + ("spoon",)]
+)
+
+# What transcript_hash() gives for the shipped mansion. Any change to what the game prints moves it,
+# so a change that should only make things faster must leave it alone
+EXPECTED = "253bdd4b23a486a4bc9ee3e2aeee307522d43f9c7e79202cf5041bf940c53c14"
+
+
+def play(seed, turns=300):
+    # One game of random lines, seeded both ways so it comes out the same every run
+    random.seed(seed)
+    rng = random.Random(seed)
+    out = BufferSink()
+    player, game_state = setup_game(out=out)
+    player.location.enter(player, game_state)
+    for _ in range(turns):
+        if game_state.end or player.steps <= 0:
+            break
+        command = rng.choice(VOCABULARY)
+        if command == "quit" and rng.random() < 0.9:
+            continue
+        handle_command(player, game_state, command)
+    return out.take()
+
+
+def transcript_hash(games=150, turns=300):
+    digest = hashlib.sha256()
+    for seed in range(games):
+        digest.update(play(seed, turns).encode())
+    return digest.hexdigest()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Hash the transcripts of many random games.")
+    parser.add_argument("--games", type=int, default=150)
+    parser.add_argument("--turns", type=int, default=300)
+    args = parser.parse_args()
+
+    value = transcript_hash(args.games, args.turns)
+    print(value)
+    if (args.games, args.turns) == (150, 300) and value != EXPECTED:
+        raise SystemExit("The transcripts changed")